@@ -5,18 +5,32 @@ warnings.filterwarnings("ignore", category=NotOpenSSLWarning)
 
 import os
 import io
+import asyncio
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
 import csv
-import json
+import bisect
+import codecs
+import sqlite3
+import functools
+from collections import Counter
+import importlib.util
+import orjson
+from cachetools import TTLCache
+from aiolimiter import AsyncLimiter
 import datetime
 from datetime import datetime, timedelta
-from PIL import Image
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from telegram.constants import ChatAction
+from telegram.request import HTTPXRequest
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -35,14 +49,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ——— QR scanning support —————————————————————————————————————————————————————
-try:
-    from pyzbar.pyzbar import decode as zbar_decode
-    logger.info("📷 QR/barcode scanning ENABLED")
-except ImportError:
-    zbar_decode = None
+# zxing-cpp is preferred (faster, tolerates damaged codes); pyzbar is the fallback.
+# Backends are only located here and imported on the first photo, so libzbar and
+# Pillow never load for a bot that doesn't receive photos.
+QR_BACKEND = next((m for m in ("zxingcpp", "pyzbar") if importlib.util.find_spec(m)), None)
+QR_ENABLED = QR_BACKEND is not None
+if QR_ENABLED:
+    logger.info("📷 QR/barcode scanning ENABLED (%s)", QR_BACKEND)
+else:
     logger.warning(
-        "📷 QR/barcode scanning DISABLED. Install zbar (`brew install zbar`), then "
-        "`pip install --upgrade pyzbar pillow`."
+        "📷 QR/barcode scanning DISABLED. `pip install zxing-cpp`, or install zbar "
+        "(`brew install zbar`) and `pip install --upgrade pyzbar pillow`."
     )
 
 # ——— Load configuration —————————————————————————————————————————————————
@@ -58,6 +75,87 @@ HEADERS       = {
     "X-Shopify-Access-Token": ADMIN_TOKEN,
 }
 
+# Shared async HTTP client (pooled keep-alive connections; HTTP/2 lets
+# concurrent Shopify calls multiplex over one connection). Shopify calls pass
+# HEADERS per request so the admin token never leaks to CDN/image hosts.
+HTTP_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(30.0),
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    follow_redirects=True,
+)
+
+# The Sheets CSV is streamed and parsed in a worker thread, so it keeps its own
+# pooled synchronous session (no Shopify headers).
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=list(_RETRY_STATUSES))
+
+CSV_SESSION = requests.Session()
+CSV_SESSION.mount("https://", HTTPAdapter(max_retries=_RETRY))
+
+# Optional shared cache. With REDIS_URL set (and redis-py installed), product
+# cards, inventory item GIDs and sales aggregates survive restarts and are
+# shared between bot processes; without it only the in-process caches apply.
+REDIS_URL = os.getenv("REDIS_URL")
+# Redis is only a cache: calls give up quickly, and after a connection error
+# it is skipped for REDIS_BACKOFF seconds instead of paying the timeout on
+# every lookup.
+REDIS_TIMEOUT = 0.5
+REDIS_BACKOFF = 30
+if REDIS_URL and importlib.util.find_spec("redis"):
+    import redis.asyncio as aioredis
+    REDIS = aioredis.Redis.from_url(REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT,
+                                    socket_timeout=REDIS_TIMEOUT)
+    _REDIS_DOWN_ERRORS = (aioredis.ConnectionError, aioredis.TimeoutError, OSError, asyncio.TimeoutError)
+else:
+    REDIS = None
+    _REDIS_DOWN_ERRORS = (OSError, asyncio.TimeoutError)
+_redis_down_until = 0.0
+
+def _redis():
+    """The Redis client, or None when unconfigured or backing off after a failure."""
+    if REDIS is None or time.monotonic() < _redis_down_until:
+        return None
+    return REDIS
+
+def _redis_failed(op, key, e):
+    global _redis_down_until
+    if isinstance(e, _REDIS_DOWN_ERRORS):
+        _redis_down_until = time.monotonic() + REDIS_BACKOFF
+        logger.warning("Redis %s %s failed (%s); skipping Redis for %ss", op, key, e, REDIS_BACKOFF)
+    else:
+        logger.warning("Redis %s %s failed: %s", op, key, e)
+
+async def shared_cache_get(key):
+    """Read a JSON value from Redis; a miss or any Redis failure returns None."""
+    redis = _redis()
+    if redis is None:
+        return None
+    try:
+        raw = await redis.get(key)
+    except Exception as e:
+        _redis_failed("GET", key, e)
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+async def shared_cache_set(key, value, ttl):
+    redis = _redis()
+    if redis is None:
+        return
+    try:
+        await redis.set(key, orjson.dumps(value), ex=ttl)
+    except Exception as e:
+        _redis_failed("SET", key, e)
+
+async def shared_cache_delete(*keys):
+    redis = _redis()
+    if redis is None or not keys:
+        return
+    try:
+        await redis.delete(*keys)
+    except Exception as e:
+        _redis_failed("DEL", keys, e)
+
 CURRENCY_SYMBOLS = {
     "USD": "$", "INR": "₹", "EUR": "€", "GBP": "£",
     "CAD": "$", "AUD": "$", "JPY": "¥"
@@ -137,7 +235,8 @@ COMMANDS_TEXT = (
     "/search    — Search (/search <keyword>)\n"
     "/export    — Export data (/export inventory|orders)\n"
     "/backup    — Create backup\n"
-    "/notifications — Manage notifications\n\n"
+    "/notifications — Manage notifications\n"
+    "/refreshloc — Re-fetch the store location\n\n"
     
     "📋 *Examples:*\n"
     "• /bulk_set SKU001 10 SKU002 5 SKU003 15\n"
@@ -162,65 +261,192 @@ Last updated: July 23, 2025
 CSV_URL = "https://docs.google.com/spreadsheets/d/1uXMgo2HjqIsMUy961exC2Ji0HtGfOP5ibqCdmFCUX6w/export?format=csv"
 PROCESSED_FILE = "processed_tracking_ids.txt"
 
-def get_processed_ids():
-    try:
-        with open(PROCESSED_FILE, "r") as f:
-            return set(line.strip() for line in f)
-    except FileNotFoundError:
-        return set()
+# Shopify REST allows ~2 req/s per store; fanned-out calls share this bucket.
+SHOPIFY_REST_LIMIT = AsyncLimiter(2, 1)
+
+# Safe to resend after a 5xx or dropped connection; a POST may already have
+# created its fulfillment.
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+
+async def shopify_rest(method, url, **kwargs):
+    """Shopify REST call on the shared async client, under the REST rate limit.
+
+    429s are retried for every method (Shopify never executes a request it
+    throttles), honouring Retry-After. 5xx responses and network errors are
+    retried only for idempotent methods, so fulfillments can't be created
+    twice. A ``json=`` body is serialized with orjson rather than httpx's
+    stdlib encoder.
+    """
+    if "json" in kwargs:
+        kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+    idempotent = method in _IDEMPOTENT_METHODS
+    for attempt in range(4):
+        last = attempt == 3
+        try:
+            async with SHOPIFY_REST_LIMIT:
+                resp = await HTTP_CLIENT.request(method, url, headers=HEADERS, **kwargs)
+        except httpx.TransportError:
+            if not idempotent or last:
+                raise
+            await asyncio.sleep(0.3 * 2 ** attempt)
+            continue
+        retry = resp.status_code == 429 or (idempotent and resp.status_code in _RETRY_STATUSES)
+        if not retry or last:
+            return resp
+        await asyncio.sleep(float(resp.headers.get("Retry-After") or 0.3 * 2 ** attempt))
+
+# Processed tracking IDs, inventory alerts and support tickets live in one
+# SQLite database (WAL), so lookups are index hits and each update touches one
+# row instead of rewriting a whole file.
+BOT_DB = "bot.db"
+_DB = None
+
+def _db_is_empty(db, table):
+    return db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+def get_db():
+    global _DB
+    if _DB is None:
+        _DB = sqlite3.connect(BOT_DB, check_same_thread=False)
+        _DB.execute("PRAGMA journal_mode=WAL")
+        _DB.execute("PRAGMA synchronous=NORMAL")
+        _DB.execute("CREATE TABLE IF NOT EXISTS processed (id TEXT PRIMARY KEY)")
+        _DB.execute("CREATE TABLE IF NOT EXISTS alerts (sku TEXT PRIMARY KEY, threshold INT)")
+        _DB.execute("CREATE TABLE IF NOT EXISTS tickets (id TEXT PRIMARY KEY, json TEXT)")
+        _DB.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # One-time import of the legacy flat files
+        if os.path.exists(PROCESSED_FILE) and _db_is_empty(_DB, "processed"):
+            with open(PROCESSED_FILE, "r") as f:
+                _DB.executemany("INSERT OR IGNORE INTO processed (id) VALUES (?)",
+                                ((line.strip(),) for line in f if line.strip()))
+        if _db_is_empty(_DB, "alerts"):
+            _DB.executemany("INSERT OR IGNORE INTO alerts (sku, threshold) VALUES (?, ?)",
+                            load_json_file(INVENTORY_ALERTS_FILE).items())
+        if _db_is_empty(_DB, "tickets"):
+            _DB.executemany("INSERT OR IGNORE INTO tickets (id, json) VALUES (?, ?)",
+                            ((k, orjson.dumps(v).decode()) for k, v in load_json_file(SUPPORT_TICKETS_FILE).items()))
+        _DB.commit()
+    return _DB
+
+def get_meta(key):
+    row = get_db().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(key, value):
+    db = get_db()
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    db.commit()
+
+def is_processed(tracking_id):
+    return get_db().execute("SELECT 1 FROM processed WHERE id=?", (tracking_id,)).fetchone() is not None
 
 def save_processed_ids(ids):
-    with open(PROCESSED_FILE, "a") as f:
-        for id in ids:
-            f.write(f"{id}\n")
+    db = get_db()
+    db.executemany("INSERT OR IGNORE INTO processed (id) VALUES (?)", ((id,) for id in ids))
+    db.commit()
+
+TRACKING_COLUMNS = ("TRACKING ID", "SHOPIFY ORDER ID", "STATUS")
+
+def iter_tracking_rows(validators):
+    """Stream the tracking sheet as (tracking_id, order_name, status) tuples.
+
+    Column positions are resolved once from the header; a missing column or a
+    short row yields None for that field. The sheet is fetched conditionally, so
+    an unchanged sheet (304) yields nothing. The response's ETag/Last-Modified
+    are put in `validators`; callers persist them with save_csv_validators()
+    only after the new rows have been handled.
+    """
+    headers = {}
+    etag, last_modified = get_meta("csv_etag"), get_meta("csv_last_modified")
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = CSV_SESSION.get(CSV_URL, headers=headers, stream=True)
+    with response:
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+        reader = csv.reader(codecs.iterdecode(response.iter_lines(), "utf-8"))
+        header = next(reader, [])
+        idx = [header.index(c) if c in header else None for c in TRACKING_COLUMNS]
+        for row in reader:
+            n = len(row)
+            yield tuple(row[i] if i is not None and i < n else None for i in idx)
+    validators["csv_etag"] = response.headers.get("ETag")
+    validators["csv_last_modified"] = response.headers.get("Last-Modified")
+
+def save_csv_validators(validators):
+    for key, value in validators.items():
+        if value:
+            set_meta(key, value)
+
+def new_tracking_rows(validators):
+    """Sheet rows whose tracking ID hasn't been processed yet."""
+    return [row for row in iter_tracking_rows(validators) if row[0] and not is_processed(row[0])]
 
 def fetch_new_tracking_ids():
-    processed = get_processed_ids()
-    response = requests.get(CSV_URL)
-    response.raise_for_status()
-    new_ids = []
-    reader = csv.DictReader(response.text.splitlines())
-    for row in reader:
-        tracking_id = row.get("TRACKING ID")
-        if tracking_id and tracking_id not in processed:
-            new_ids.append(tracking_id)
+    validators = {}
+    new_ids = [row[0] for row in new_tracking_rows(validators)]
     save_processed_ids(new_ids)
+    save_csv_validators(validators)
     return new_ids
 
-def get_shopify_order_by_name(order_name):
+async def get_shopify_order_by_name(order_name, fields=None):
     # Remove leading # if present
     order_name = order_name.lstrip('#')
-    query = f"orders.json?name=%23{order_name}"
-    url = f"https://{STORE}/admin/api/{API_VER}/{query}"
-    resp = requests.get(url, headers=HEADERS)
+    url = f"https://{STORE}/admin/api/{API_VER}/orders.json"
+    params = {"name": f"#{order_name}"}
+    if fields:
+        params["fields"] = fields
+    resp = await shopify_rest("GET", url, params=params)
     resp.raise_for_status()
-    orders = resp.json().get('orders', [])
+    orders = orjson.loads(resp.content).get('orders', [])
     if not orders:
         return None
     return orders[0]
 
-def set_shipping_carrier(order_id, carrier_name="India Post Domestic"):
+# Short-lived cache for read-only order lookups (/status, /order). Commands
+# that modify an order always fetch fresh and drop the cached copy.
+_ORDER_CACHE = TTLCache(maxsize=1024, ttl=30)
+
+# Columns needed by commands that only append to the note or tags
+ORDER_NOTE_FIELDS = "id,note,tags"
+
+async def get_order(order_name, for_update=False, fields=None):
+    key = order_name.lstrip('#')
+    if for_update:
+        _ORDER_CACHE.pop(key, None)
+        return await get_shopify_order_by_name(order_name, fields)
+    order = _ORDER_CACHE.get(key)
+    if order is None:
+        order = await get_shopify_order_by_name(order_name)
+        if order is not None:
+            _ORDER_CACHE[key] = order
+    return order
+
+async def set_shipping_carrier(order_id, carrier_name="India Post Domestic"):
     url = f"https://{STORE}/admin/api/{API_VER}/orders/{order_id}.json"
     payload = {"order": {"id": order_id, "shipping_lines": [{"title": carrier_name}]}}
-    resp = requests.put(url, json=payload, headers=HEADERS)
+    resp = await shopify_rest("PUT", url, json=payload)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
 
-def mark_variant_out_of_stock(variant_id):
+async def mark_variant_out_of_stock(variant_id):
     # Set inventory to 0 for the variant
-    item_gid, loc_gid = graphql_get_item_and_location_ids(variant_id)
+    item_gid, loc_gid = await graphql_get_item_and_location_ids(variant_id)
     if not item_gid or not loc_gid:
         return False
-    _, errs = graphql_set_quantities(item_gid, loc_gid, 0)
+    _, errs = await graphql_set_quantities(item_gid, loc_gid, 0)
     return errs is None
 
-def get_variant_inventory(sku):
-    prod = get_product_by_sku(sku)
-    if not prod or not prod["variants"]:
+async def get_variant_inventory(sku):
+    variant = await get_product_inventory(sku)
+    if not variant:
         return None
-    return prod["variants"][0]["inventory"]
+    return variant["inventory"]
 
-def add_tracking_to_order(order, tracking_id, carrier=None):
+async def add_tracking_to_order(order, tracking_id, carrier=None):
     url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}/fulfillments.json"
     line_items = [{"id": item["id"], "quantity": item["quantity"]} for item in order.get("line_items", [])]
     # Get location_id from the first fulfillable line item with manual fulfillment
@@ -230,7 +456,7 @@ def add_tracking_to_order(order, tracking_id, carrier=None):
             location_id = item.get("location_id")
             break
     if not location_id:
-        print("No valid location_id found for fulfillment.")
+        logger.warning("No valid location_id found for fulfillment.")
         raise Exception("No valid location_id found for fulfillment.")
     payload = {
         "fulfillment": {
@@ -241,91 +467,63 @@ def add_tracking_to_order(order, tracking_id, carrier=None):
             "location_id": location_id
         }
     }
-    print("Payload being sent to Shopify:", payload)
-    resp = requests.post(url, json=payload, headers=HEADERS)
+    logger.debug("Shopify fulfillment payload: %s", payload)
+    resp = await shopify_rest("POST", url, json=payload)
     try:
         resp.raise_for_status()
     except Exception as e:
-        print(f"Shopify fulfillment error: {resp.status_code} {resp.text}")
+        logger.error("Shopify fulfillment error: %s %s", resp.status_code, resp.text)
         raise
-    return resp.json()
+    return orjson.loads(resp.content)
+
+_Q_ORDER_UPDATE = """
+mutation($input:OrderInput!){
+  orderUpdate(input:$input){
+    order{id note}
+    userErrors{field message}
+  }
+}
+"""
 
-def reschedule_delivery(order, new_date, reason, delivery_partner="India Post Domestic"):
+async def graphql_append_order_note(order, text, extra_tags=None):
     """
-    Reschedule delivery for an order by updating the shipping line with new delivery date
-    and adding a note about the reschedule reason.
+    Append text to an order's note (and optionally add tags) with a single
+    orderUpdate; only the id, note and tags travel over the wire.
+    """
+    note = order.get("note") or ""
+    order_input = {"id": f"gid://shopify/Order/{order['id']}", "note": note + text if note else text}
+    if extra_tags:
+        tags = [t.strip() for t in (order.get("tags") or "").split(",") if t.strip()]
+        order_input["tags"] = tags + [t for t in extra_tags if t not in tags]
+    data = await _graphql_post(_Q_ORDER_UPDATE, {"input": order_input})
+    errs = data.get("errors") or data["data"]["orderUpdate"]["userErrors"]
+    if errs:
+        logger.error("Shopify orderUpdate errors: %s", errs)
+        raise Exception(errs[0]["message"])
+    return data["data"]["orderUpdate"]["order"]
+
+async def reschedule_delivery(order, new_date, reason, delivery_partner="India Post Domestic"):
+    """
+    Reschedule delivery for an order by appending the new delivery date,
+    reason and partner to the order note.
     """
-    url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}.json"
-    
-    # Update shipping line with new delivery date and partner
-    shipping_lines = order.get("shipping_lines", [])
-    if shipping_lines:
-        shipping_lines[0]["title"] = f"{delivery_partner} - Rescheduled to {new_date}"
-    else:
-        # Create new shipping line if none exists
-        shipping_lines = [{"title": f"{delivery_partner} - Rescheduled to {new_date}"}]
-    
-    # Add note about reschedule
-    note = order.get("note", "")
     reschedule_note = f"\n--- RESCHEDULE INFO ---\nNew Delivery Date: {new_date}\nReason: {reason}\nDelivery Partner: {delivery_partner}\nRescheduled on: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-    updated_note = note + reschedule_note if note else reschedule_note
-    
-    payload = {
-        "order": {
-            "id": order["id"],
-            "shipping_lines": shipping_lines,
-            "note": updated_note
-        }
-    }
     
-    print("Reschedule payload being sent to Shopify:", payload)
-    resp = requests.put(url, json=payload, headers=HEADERS)
-    try:
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Shopify reschedule error: {resp.status_code} {resp.text}")
-        raise
-    return resp.json()
+    logger.debug("Shopify reschedule note: %s", reschedule_note)
+    return await graphql_append_order_note(order, reschedule_note)
 
-def update_delivery_partner(order, new_partner):
+async def update_delivery_partner(order, new_partner):
     """
-    Update the delivery partner for an order.
+    Update the delivery partner for an order by appending it to the order note.
     """
-    url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}.json"
-    
-    shipping_lines = order.get("shipping_lines", [])
-    if shipping_lines:
-        current_title = shipping_lines[0]["title"]
-        # Preserve any existing delivery date info
-        if "Rescheduled to" in current_title:
-            date_part = current_title.split("Rescheduled to")[1].strip()
-            shipping_lines[0]["title"] = f"{new_partner} - Rescheduled to {date_part}"
-        else:
-            shipping_lines[0]["title"] = new_partner
-    else:
-        shipping_lines = [{"title": new_partner}]
-    
-    # Add note about partner change
-    note = order.get("note", "")
     partner_note = f"\n--- DELIVERY PARTNER UPDATE ---\nNew Partner: {new_partner}\nUpdated on: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-    updated_note = note + partner_note if note else partner_note
     
-    payload = {
-        "order": {
-            "id": order["id"],
-            "shipping_lines": shipping_lines,
-            "note": updated_note
-        }
-    }
-    
-    print("Partner update payload being sent to Shopify:", payload)
-    resp = requests.put(url, json=payload, headers=HEADERS)
-    try:
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Shopify partner update error: {resp.status_code} {resp.text}")
-        raise
-    return resp.json()
+    logger.debug("Shopify partner update note: %s", partner_note)
+    return await graphql_append_order_note(order, partner_note)
+
+RESCHEDULE_RE = re.compile(r"--- RESCHEDULE INFO ---(.*?)(?=--- RESCHEDULE INFO ---|\Z)", re.S)
+PARTNER_RE    = re.compile(r"--- DELIVERY PARTNER UPDATE ---(.*?)(?=--- DELIVERY PARTNER UPDATE ---|\Z)", re.S)
+KV_RE         = re.compile(r"^([^:\n]+):(.*)$", re.M)
 
 def get_delivery_status(order):
     """
@@ -355,33 +553,20 @@ def get_delivery_status(order):
         delivery_info["tracking_number"] = latest_fulfillment.get("tracking_number", "Not available")
         delivery_info["tracking_company"] = latest_fulfillment.get("tracking_company", "Unknown")
     
-    # Parse note for history
-    note = order.get("note", "")
-    if "RESCHEDULE INFO" in note:
-        # Extract reschedule history from notes
-        reschedule_sections = note.split("--- RESCHEDULE INFO ---")
-        for section in reschedule_sections[1:]:  # Skip first empty section
-            lines = section.strip().split("\n")
-            reschedule_entry = {}
-            for line in lines:
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    reschedule_entry[key.strip()] = value.strip()
-            if reschedule_entry:
-                delivery_info["reschedule_history"].append(reschedule_entry)
-    
-    if "DELIVERY PARTNER UPDATE" in note:
-        # Extract partner history from notes
-        partner_sections = note.split("--- DELIVERY PARTNER UPDATE ---")
-        for section in partner_sections[1:]:  # Skip first empty section
-            lines = section.strip().split("\n")
-            partner_entry = {}
-            for line in lines:
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    partner_entry[key.strip()] = value.strip()
-            if partner_entry:
-                delivery_info["partner_history"].append(partner_entry)
+    # Parse note for history in one pass per section type
+    note = order.get("note") or ""
+    for history, section_re in (("reschedule_history", RESCHEDULE_RE),
+                                ("partner_history", PARTNER_RE)):
+        for m in section_re.finditer(note):
+            entry = {k.strip(): v.strip() for k, v in KV_RE.findall(m.group(1))}
+            if entry:
+                delivery_info[history].append(entry)
+    
+    # Reschedules and partner changes are recorded in the note; latest entry wins
+    if delivery_info["reschedule_history"]:
+        delivery_info["delivery_date"] = delivery_info["reschedule_history"][-1].get("New Delivery Date", delivery_info["delivery_date"])
+    if delivery_info["partner_history"]:
+        delivery_info["current_partner"] = delivery_info["partner_history"][-1].get("New Partner", delivery_info["current_partner"])
     
     return delivery_info
 
@@ -389,52 +574,132 @@ def get_delivery_status(order):
 def load_json_file(filename):
     """Load data from JSON file"""
     try:
-        with open(filename, 'r') as f:
-            return json.load(f)
+        with open(filename, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+
+# filename -> (st_mtime_ns, parsed data) for small, rarely-changing settings files
+_JSON_CACHE = {}
+
+def load_json_file_cached(filename):
+    """Like load_json_file, but reuses the parsed data while the file's mtime is unchanged"""
+    try:
+        mtime = os.stat(filename).st_mtime_ns
     except FileNotFoundError:
+        _JSON_CACHE.pop(filename, None)
         return {}
+    cached = _JSON_CACHE.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    data = load_json_file(filename)
+    _JSON_CACHE[filename] = (mtime, data)
+    return data
 
 def save_json_file(filename, data):
-    """Save data to JSON file"""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save data to JSON file atomically and keep it resident in the cache"""
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp, filename)
+    _JSON_CACHE[filename] = (os.stat(filename).st_mtime_ns, data)
 
 def get_inventory_alerts():
     """Get inventory alerts"""
-    return load_json_file(INVENTORY_ALERTS_FILE)
-
-def save_inventory_alerts(alerts):
-    """Save inventory alerts"""
-    save_json_file(INVENTORY_ALERTS_FILE, alerts)
-
-def check_low_stock_alerts():
+    return dict(get_db().execute("SELECT sku, threshold FROM alerts"))
+
+def set_inventory_alert(sku, threshold):
+    """Create or update one inventory alert"""
+    db = get_db()
+    db.execute("INSERT OR REPLACE INTO alerts (sku, threshold) VALUES (?, ?)", (sku, threshold))
+    db.commit()
+    invalidate_low_stock()
+
+_INFLIGHT = {}
+
+def single_flight(fn):
+    """Concurrent calls with the same arguments share one in-flight call, so a
+    burst of identical button taps costs a single Shopify fetch."""
+    @functools.wraps(fn)
+    async def wrapper(*args):
+        key = (fn.__name__, *args)
+        fut = _INFLIGHT.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn(*args))
+            _INFLIGHT[key] = fut
+            fut.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+        return await asyncio.shield(fut)
+    return wrapper
+
+# Recent /check_alerts, /report and quick-menu results, so repeated invocations
+# don't redo the Shopify work. Alert and inventory writes clear the stock
+# entry; /cancel clears the pending-orders entry.
+_LOW_STOCK_CACHE = TTLCache(maxsize=1, ttl=60)
+_SALES_CACHE = TTLCache(maxsize=8, ttl=60)
+_PENDING_CACHE = TTLCache(maxsize=1, ttl=15)
+# Redis TTLs: today's numbers move quickly, a 30-day window barely changes
+SALES_SHARED_TTL = {"today": 30, "week": 120, "month": 300}
+
+def invalidate_low_stock():
+    _LOW_STOCK_CACHE.clear()
+
+@single_flight
+async def check_low_stock_alerts():
     """Check for low stock alerts"""
+    cached = _LOW_STOCK_CACHE.get("items")
+    if cached is not None:
+        return cached
     alerts = get_inventory_alerts()
     low_stock_items = []
     
+    # One inventory snapshot per 100 SKUs instead of one request per alert.
+    # A failed batch raises, so only a complete snapshot ever reaches the cache.
+    _, found = await graphql_get_ids_and_inventory_many(alerts)
+    stock = {sku: qty for sku, (_, qty) in found.items()}
+    
     for sku, threshold in alerts.items():
-        inventory = get_variant_inventory(sku)
+        inventory = stock.get(sku)
         if inventory is not None and inventory <= threshold:
             low_stock_items.append({"sku": sku, "current": inventory, "threshold": threshold})
     
+    _LOW_STOCK_CACHE["items"] = low_stock_items
     return low_stock_items
 
+def _zone_segments(zones):
+    """Split the (possibly overlapping) pincode ranges into sorted, disjoint
+    segments; where ranges overlap, the zone listed first wins."""
+    bounds = sorted({b for info in zones.values() for start, end in info["range"] for b in (start, end + 1)})
+    segments = []
+    for b in bounds:
+        hit = None
+        for zone, info in zones.items():
+            if any(start <= b <= end for start, end in info["range"]):
+                hit = (zone, info["delivery_time"])
+                break
+        segments.append(hit)
+    return bounds, segments
+
+_ZONE_BOUNDS, _ZONE_SEGMENTS = _zone_segments(DELIVERY_ZONES)
+PINCODE_RE = re.compile(r"\d+")
+
 def get_delivery_zone(pincode):
     """Get delivery zone for pincode"""
-    try:
-        pincode = int(pincode)
-        for zone, info in DELIVERY_ZONES.items():
-            for start, end in info["range"]:
-                if start <= pincode <= end:
-                    return zone, info["delivery_time"]
-        return "Not Available", "N/A"
-    except ValueError:
+    return _delivery_zone(str(pincode).strip())
+
+@functools.lru_cache(maxsize=100_000)
+def _delivery_zone(pincode):
+    if not PINCODE_RE.fullmatch(pincode):
         return "Invalid", "N/A"
+    i = bisect.bisect_right(_ZONE_BOUNDS, int(pincode)) - 1
+    if i < 0 or _ZONE_SEGMENTS[i] is None:
+        return "Not Available", "N/A"
+    return _ZONE_SEGMENTS[i]
 
 def create_support_ticket(order_id, description, user_id):
     """Create support ticket"""
-    tickets = load_json_file(SUPPORT_TICKETS_FILE)
-    ticket_id = f"TICKET-{len(tickets) + 1:04d}"
+    db = get_db()
+    (count,) = db.execute("SELECT COUNT(*) FROM tickets").fetchone()
+    ticket_id = f"TICKET-{count + 1:04d}"
     
     ticket = {
         "id": ticket_id,
@@ -446,39 +711,84 @@ def create_support_ticket(order_id, description, user_id):
         "updated_at": datetime.now().isoformat()
     }
     
-    tickets[ticket_id] = ticket
-    save_json_file(SUPPORT_TICKETS_FILE, tickets)
+    db.execute("INSERT INTO tickets (id, json) VALUES (?, ?)", (ticket_id, orjson.dumps(ticket).decode()))
+    db.commit()
     return ticket
 
 def get_support_tickets():
     """Get all support tickets"""
-    return load_json_file(SUPPORT_TICKETS_FILE)
+    rows = get_db().execute("SELECT id, json FROM tickets ORDER BY rowid")
+    return {ticket_id: orjson.loads(data) for ticket_id, data in rows}
 
 def update_ticket_status(ticket_id, status):
     """Update ticket status"""
-    tickets = get_support_tickets()
-    if ticket_id in tickets:
-        tickets[ticket_id]["status"] = status
-        tickets[ticket_id]["updated_at"] = datetime.now().isoformat()
-        save_json_file(SUPPORT_TICKETS_FILE, tickets)
-        return True
-    return False
-
-def get_orders_by_status(status="any", days=None):
+    db = get_db()
+    cur = db.execute(
+        "UPDATE tickets SET json = json_set(json, '$.status', ?, '$.updated_at', ?) WHERE id = ?",
+        (status, datetime.now().isoformat(), ticket_id))
+    db.commit()
+    return cur.rowcount > 0
+
+# Shopify rejects any query whose *requested* cost exceeds 1000 points and
+# charges each order 1 + 2 (price objects) + 2 + lineItems first. Ten line
+# items cover nearly every order here, which leaves room for 60 orders a page
+# (~900 points): 4x fewer round trips than 15 × 50 line items, at about a quarter of
+# the requested cost per order.
+_Q_ORDERS = """
+fragment OrderFields on Order{
+  name email createdAt displayFinancialStatus
+  totalPriceSet{shopMoney{amount}}
+  lineItems(first:10){edges{node{sku quantity}}}
+}
+query($q:String,$after:String){
+  orders(first:60,after:$after,query:$q,sortKey:CREATED_AT,reverse:true){
+    edges{node{...OrderFields}}
+    pageInfo{hasNextPage endCursor}
+  }
+}
+"""
+
+def _order_from_node(n):
+    """Flatten a GraphQL order node into the REST-shaped dict the handlers read."""
+    return {
+        "name":             n["name"],
+        "email":            n.get("email"),
+        "created_at":       n["createdAt"],
+        "financial_status": (n.get("displayFinancialStatus") or "").lower(),
+        "total_price":      n["totalPriceSet"]["shopMoney"]["amount"],
+        "line_items":       [e["node"] for e in n["lineItems"]["edges"]],
+    }
+
+async def get_orders_by_status(status="any", days=None):
     """Get orders by status and date range"""
-    url = f"https://{STORE}/admin/api/{API_VER}/orders.json"
-    params = {"status": status, "limit": 250}
-    
+    terms = []
+    if status != "any":
+        terms.append(f"status:{status}")
     if days:
         since_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        params["created_at_min"] = since_date
-    
-    resp = requests.get(url, headers=HEADERS, params=params)
-    resp.raise_for_status()
-    return resp.json().get("orders", [])
-
-def get_sales_data(period="today"):
+        terms.append(f"created_at:>={since_date}")
+    orders, after = [], None
+    while True:
+        data = await _graphql_post(_Q_ORDERS, {"q": " ".join(terms) or None, "after": after})
+        if data.get("errors"):
+            raise RuntimeError(data["errors"])
+        page = data["data"]["orders"]
+        orders.extend(_order_from_node(e["node"]) for e in page["edges"])
+        if not page["pageInfo"]["hasNextPage"]:
+            return orders
+        after = page["pageInfo"]["endCursor"]
+
+@single_flight
+async def get_sales_data(period="today"):
     """Get sales data for specified period"""
+    cached = _SALES_CACHE.get(period)
+    if cached is not None:
+        return cached
+    shared = await shared_cache_get(f"sales:{period}")
+    if shared is not None:
+        shared["products_sold"] = Counter(shared["products_sold"])
+        _SALES_CACHE[period] = shared
+        return shared
     if period == "today":
         days = 1
     elif period == "week":
@@ -488,11 +798,11 @@ def get_sales_data(period="today"):
     else:
         days = 1
     
-    orders = get_orders_by_status("any", days)
+    orders = await get_orders_by_status("any", days)
     
     total_sales = 0
     total_orders = len(orders)
-    products_sold = {}
+    products_sold = Counter()
     
     for order in orders:
         if order.get("financial_status") == "paid":
@@ -502,26 +812,37 @@ def get_sales_data(period="today"):
             sku = item.get("sku")
             qty = item.get("quantity", 0)
             if sku:
-                products_sold[sku] = products_sold.get(sku, 0) + qty
+                products_sold[sku] += qty
     
-    return {
+    sales_data = {
         "total_sales": total_sales,
         "total_orders": total_orders,
         "products_sold": products_sold,
         "period": period
     }
-
-def predict_stock_needs(sku):
+    _SALES_CACHE[period] = sales_data
+    await shared_cache_set(f"sales:{period}", sales_data, SALES_SHARED_TTL.get(period, 60))
+    return sales_data
+
+@single_flight
+async def get_pending_orders():
+    """Open orders for /orders pending and the quick menu"""
+    orders = _PENDING_CACHE.get("open")
+    if orders is None:
+        orders = _PENDING_CACHE["open"] = await get_orders_by_status("open")
+    return orders
+
+async def predict_stock_needs(sku):
     """Predict stock needs based on sales history"""
     # Get last 30 days of sales
-    sales_data = get_sales_data("month")
+    sales_data = await get_sales_data("month")
     products_sold = sales_data["products_sold"]
     
     if sku in products_sold:
         monthly_demand = products_sold[sku]
         # Predict next month demand (simple average)
         predicted_demand = monthly_demand
-        current_stock = get_variant_inventory(sku) or 0
+        current_stock = await get_variant_inventory(sku) or 0
         
         return {
             "sku": sku,
@@ -534,9 +855,9 @@ def predict_stock_needs(sku):
     else:
         return {"sku": sku, "error": "No sales data available"}
 
-def apply_discount_to_order(order_id, percentage):
+async def apply_discount_to_order(order_id, percentage):
     """Apply discount to order"""
-    order = get_shopify_order_by_name(order_id)
+    order = await get_order(order_id, for_update=True)
     if not order:
         return None
     
@@ -557,101 +878,194 @@ def apply_discount_to_order(order_id, percentage):
         }
     }
     
-    resp = requests.put(url, json=payload, headers=HEADERS)
+    resp = await shopify_rest("PUT", url, json=payload)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
+
+# Variants are paged directly (with their product inlined) so a page stays
+# well under the 1000-point query cost cap however many variants a product has.
+_Q_EXPORT_INVENTORY = """
+query($after:String){
+  productVariants(first:250,after:$after){
+    edges{node{sku title price inventoryQuantity product{title status}}}
+    pageInfo{hasNextPage endCursor}
+  }
+}
+"""
 
-def export_inventory_data():
+async def export_inventory_data():
     """Export inventory data to CSV"""
-    # Get all products
-    url = f"https://{STORE}/admin/api/{API_VER}/products.json"
-    resp = requests.get(url, headers=HEADERS)
-    resp.raise_for_status()
-    products = resp.json().get("products", [])
-    
-    csv_data = []
-    for product in products:
-        for variant in product.get("variants", []):
+    csv_data, after = [], None
+    while True:
+        data = await _graphql_post(_Q_EXPORT_INVENTORY, {"after": after})
+        if data.get("errors"):
+            raise RuntimeError(data["errors"])
+        page = data["data"]["productVariants"]
+        for edge in page["edges"]:
+            variant = edge["node"]
+            product = variant["product"]
             csv_data.append({
                 "SKU": variant.get("sku"),
                 "Product": product.get("title"),
                 "Variant": variant.get("title"),
                 "Price": variant.get("price"),
-                "Inventory": variant.get("inventory_quantity"),
-                "Status": "Active" if product.get("status") == "active" else "Inactive"
+                "Inventory": variant.get("inventoryQuantity"),
+                "Status": "Active" if product.get("status") == "ACTIVE" else "Inactive"
             })
-    
-    return csv_data
+        if not page["pageInfo"]["hasNextPage"]:
+            return csv_data
+        after = page["pageInfo"]["endCursor"]
+
+_Q_SEARCH_PRODUCTS = """
+query($q:String!){
+  products(first:50,query:$q){edges{node{
+    id title handle
+    variants(first:1){edges{node{sku price}}}
+  }}}
+}
+"""
 
-def search_products(keyword):
-    """Search products by keyword"""
-    url = f"https://{STORE}/admin/api/{API_VER}/products.json"
-    resp = requests.get(url, headers=HEADERS)
-    resp.raise_for_status()
-    products = resp.json().get("products", [])
+# Search results keyed by the normalized Shopify query; product edits clear it.
+_SEARCH_CACHE = TTLCache(maxsize=256, ttl=30)
+
+async def search_products(keyword):
+    """Search products by keyword (filtered server-side by Shopify)"""
+    terms = sorted({t.replace('"', "").replace("\\", "") for t in keyword.lower().split()} - {""})
+    q = " ".join(f"(title:*{t}* OR body:*{t}* OR vendor:*{t}* OR tag:*{t}*)" for t in terms)
+    results = _SEARCH_CACHE.get(q)
+    if results is None:
+        results = _SEARCH_CACHE[q] = await _search_products(q)
+    return results
+
+@single_flight
+async def _search_products(q):
+    data = await _graphql_post(_Q_SEARCH_PRODUCTS, {"q": q})
+    if data.get("errors"):
+        raise RuntimeError(data["errors"])
     
     results = []
-    keyword_lower = keyword.lower()
-    
-    for product in products:
-        if (keyword_lower in product.get("title", "").lower() or
-            keyword_lower in product.get("body_html", "").lower()):
-            results.append(product)
+    for edge in data["data"]["products"]["edges"]:
+        node = edge["node"]
+        results.append({
+            "id": node["id"],
+            "title": node["title"],
+            "handle": node["handle"],
+            "variants": [v["node"] for v in node["variants"]["edges"]] or [{}],
+        })
     
     return results
 
+_Q_RECENT_CUSTOMERS = """
+query($n:Int!){
+  customers(first:$n,sortKey:CREATED_AT,reverse:true){edges{node{
+    firstName lastName email numberOfOrders amountSpent{amount}
+  }}}
+}
+"""
+
+async def graphql_recent_customers(n=10):
+    """Most recently created customers, with just the fields /customers shows"""
+    data = await _graphql_post(_Q_RECENT_CUSTOMERS, {"n": n})
+    if data.get("errors"):
+        raise RuntimeError(data["errors"])
+    return [edge["node"] for edge in data["data"]["customers"]["edges"]]
+
+# Updates from different chats run concurrently; only one chat may work
+# through the tracking sheet at a time so rows aren't processed twice.
+_CHECKTRACKING_LOCK = asyncio.Lock()
+
 async def checktracking_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if _CHECKTRACKING_LOCK.locked():
+        return await update.message.reply_text("⏳ A tracking check is already running, try again shortly.")
+    async with _CHECKTRACKING_LOCK:
+        await _checktracking(update, context)
+
+async def _checktracking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Checking for new tracking IDs and orders...")
     try:
-        processed = get_processed_ids()
-        response = requests.get(CSV_URL)
-        response.raise_for_status()
-        new_ids = []
-        reader = csv.DictReader(response.text.splitlines())
-        actions = []
-        for row in reader:
-            tracking_id = row.get("TRACKING ID")
-            order_name = row.get("SHOPIFY ORDER ID")
-            status = row.get("STATUS")
-            if not tracking_id or tracking_id in processed:
-                continue
-            new_ids.append(tracking_id)
+        validators = {}
+        rows = await asyncio.to_thread(new_tracking_rows, validators)
+        new_ids = [row[0] for row in rows]
+        sem = asyncio.Semaphore(8)
+        # One inventory lookup per SKU for this run, shared across orders
+        inventory_lookups = {}
+
+        async def check_item(order_name, item):
+            sku = item.get("sku")
+            variant_id = item.get("variant_id")
+            if not sku or not variant_id:
+                return f"Order {order_name}: Missing SKU or variant ID."
+            if sku not in inventory_lookups:
+                inventory_lookups[sku] = asyncio.ensure_future(get_variant_inventory(sku))
+            try:
+                inventory = await inventory_lookups[sku]
+            except Exception as e:
+                return f"Order {order_name} SKU {sku}: Could not fetch inventory: {e}"
+            if inventory is None:
+                return f"Order {order_name} SKU {sku}: Could not fetch inventory."
+            if inventory == 0:
+                await mark_variant_out_of_stock(variant_id)
+                return f"Order {order_name} SKU {sku}: Marked as out of stock."
+            return f"Order {order_name} SKU {sku}: In stock ({inventory})."
+
+        async def packed(order, order_name, tracking_id):
+            # Add tracking and carrier
+            try:
+                await add_tracking_to_order(order, tracking_id)
+                return [f"Order {order_name}: Tracking ID {tracking_id} and carrier set to India Post Domestic."]
+            except Exception as e:
+                return [f"Order {order_name}: Failed to add tracking/carrier: {e}"]
+
+        async def check_stock(order, order_name, tracking_id):
+            # Check each line item SKU
+            row_actions = list(await asyncio.gather(
+                *(check_item(order_name, item) for item in order.get("line_items", []))))
+            # Set shipping carrier
+            await set_shipping_carrier(order["id"])
+            row_actions.append(f"Order {order_name}: Shipping carrier set to India Post Domestic.")
+            return row_actions
+
+        # Sheet STATUS → row action; anything unlisted gets the stock check
+        row_handlers = {"PACKED": packed}
+
+        async def check_row(tracking_id, order_name, status):
             if not order_name:
-                actions.append(f"Tracking ID {tracking_id}: No order ID found.")
-                continue
-            order = get_shopify_order_by_name(order_name)
-            if not order:
-                actions.append(f"Order {order_name} not found for tracking ID {tracking_id}.")
-                continue
-            if status and status.strip().upper() == "PACKED":
-                # Add tracking and carrier
+                return [f"Tracking ID {tracking_id}: No order ID found."]
+            async with sem:
+                order = await get_order(order_name, for_update=True)
+                if not order:
+                    return [f"Order {order_name} not found for tracking ID {tracking_id}."]
+                handler = row_handlers.get(status.strip().upper() if status else "", check_stock)
+                return await handler(order, order_name, tracking_id)
+
+        results = [None] * len(rows)
+        unfinished = set()
+
+        async def check_order_rows(indices):
+            # Rows for one order run in sheet order, so two of them can never
+            # fulfil or update the same order at once; orders still run in
+            # parallel. A failure is reported once every order has finished,
+            # and stops that order's remaining rows, which stay unprocessed
+            # so the next run retries them.
+            for n, i in enumerate(indices):
                 try:
-                    add_tracking_to_order(order, tracking_id)
-                    actions.append(f"Order {order_name}: Tracking ID {tracking_id} and carrier set to India Post Domestic.")
+                    results[i] = await check_row(*rows[i])
                 except Exception as e:
-                    actions.append(f"Order {order_name}: Failed to add tracking/carrier: {e}")
-                continue
-            # Check each line item SKU
-            for item in order.get("line_items", []):
-                sku = item.get("sku")
-                variant_id = item.get("variant_id")
-                if not sku or not variant_id:
-                    actions.append(f"Order {order_name}: Missing SKU or variant ID.")
-                    continue
-                inventory = get_variant_inventory(sku)
-                if inventory is None:
-                    actions.append(f"Order {order_name} SKU {sku}: Could not fetch inventory.")
-                    continue
-                if inventory == 0:
-                    mark_variant_out_of_stock(variant_id)
-                    actions.append(f"Order {order_name} SKU {sku}: Marked as out of stock.")
-                else:
-                    actions.append(f"Order {order_name} SKU {sku}: In stock ({inventory}).")
-            # Set shipping carrier
-            set_shipping_carrier(order["id"])
-            actions.append(f"Order {order_name}: Shipping carrier set to India Post Domestic.")
-            time.sleep(0.5)  # avoid rate limits
-        save_processed_ids(new_ids)
+                    logger.exception("checktracking failed for tracking ID %s", rows[i][0])
+                    unfinished.update(indices[n:])
+                    results[i] = [f"Tracking ID {rows[i][0]}: Failed ({e}); "
+                                  f"{len(indices) - n} row(s) for order {rows[i][1]} will be retried next run."]
+                    return
+
+        by_order = {}
+        for i, (_, order_name, _) in enumerate(rows):
+            by_order.setdefault(order_name.lstrip("#") if order_name else i, []).append(i)
+        await asyncio.gather(*(check_order_rows(g) for g in by_order.values()))
+        actions = [a for row_actions in results if row_actions for a in row_actions]
+        save_processed_ids([tid for i, tid in enumerate(new_ids) if i not in unfinished])
+        if not unfinished:
+            # Otherwise the next run would get a 304 and never see the failed rows
+            save_csv_validators(validators)
         if actions:
             await update.message.reply_text("\n".join(actions))
         else:
@@ -667,11 +1081,11 @@ async def fulfill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_name = args[0]
     tracking_id = args[1]
     # Ignore user-supplied carrier, always use India Post Domestic
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     try:
-        result = add_tracking_to_order(order, tracking_id)
+        result = await add_tracking_to_order(order, tracking_id)
         await update.message.reply_text(
             f"Order {order_name} fulfilled!\nTracking ID: {tracking_id}\nCarrier: India Post Domestic")
     except Exception as e:
@@ -686,12 +1100,12 @@ async def reschedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     new_date = args[1]
     reason = " ".join(args[2:])  # Combine remaining args as reason
     
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
-        result = reschedule_delivery(order, new_date, reason)
+        result = await reschedule_delivery(order, new_date, reason)
         await update.message.reply_text(
             f"✅ Order {order_name} rescheduled!\n"
             f"New Delivery Date: {new_date}\n"
@@ -709,12 +1123,12 @@ async def partner_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_name = args[0]
     new_partner = " ".join(args[1:])  # Combine remaining args as partner name
     
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
-        result = update_delivery_partner(order, new_partner)
+        result = await update_delivery_partner(order, new_partner)
         await update.message.reply_text(
             f"✅ Order {order_name} delivery partner updated!\n"
             f"New Partner: {new_partner}\n"
@@ -723,106 +1137,121 @@ async def partner_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to update delivery partner for order {order_name}: {e}")
 
+_STATUS_HEADER = (
+    "📦 *Delivery Status for Order {0}*\n\n"
+    "*Current Partner:* {1[current_partner]}\n"
+    "*Delivery Date:* {1[delivery_date]}\n"
+    "*Tracking Number:* {1[tracking_number]}\n"
+    "*Tracking Company:* {1[tracking_company]}\n\n"
+)
+_RESCHEDULE_LINE = "{0}. Date: {1}\n   Reason: {2}\n   Partner: {3}\n\n"
+_PARTNER_LINE    = "{0}. Partner: {1}\n   Updated: {2}\n\n"
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if len(args) < 1:
         return await update.message.reply_text("Usage: /status <SHOPIFY_ORDER_ID>")
     
     order_name = args[0]
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
         delivery_info = get_delivery_status(order)
         
-        status_message = f"📦 *Delivery Status for Order {order_name}*\n\n"
-        status_message += f"*Current Partner:* {delivery_info['current_partner']}\n"
-        status_message += f"*Delivery Date:* {delivery_info['delivery_date']}\n"
-        status_message += f"*Tracking Number:* {delivery_info['tracking_number']}\n"
-        status_message += f"*Tracking Company:* {delivery_info['tracking_company']}\n\n"
+        parts = [_STATUS_HEADER.format(order_name, delivery_info)]
         
         if delivery_info['reschedule_history']:
-            status_message += "*📅 Reschedule History:*\n"
-            for i, reschedule in enumerate(delivery_info['reschedule_history'], 1):
-                status_message += f"{i}. Date: {reschedule.get('New Delivery Date', 'N/A')}\n"
-                status_message += f"   Reason: {reschedule.get('Reason', 'N/A')}\n"
-                status_message += f"   Partner: {reschedule.get('Delivery Partner', 'N/A')}\n\n"
+            parts.append("*📅 Reschedule History:*\n")
+            parts.extend(
+                _RESCHEDULE_LINE.format(i, r.get('New Delivery Date', 'N/A'), r.get('Reason', 'N/A'),
+                                        r.get('Delivery Partner', 'N/A'))
+                for i, r in enumerate(delivery_info['reschedule_history'], 1))
         
         if delivery_info['partner_history']:
-            status_message += "*🚚 Partner History:*\n"
-            for i, partner in enumerate(delivery_info['partner_history'], 1):
-                status_message += f"{i}. Partner: {partner.get('New Partner', 'N/A')}\n"
-                status_message += f"   Updated: {partner.get('Updated on', 'N/A')}\n\n"
+            parts.append("*🚚 Partner History:*\n")
+            parts.extend(
+                _PARTNER_LINE.format(i, p.get('New Partner', 'N/A'), p.get('Updated on', 'N/A'))
+                for i, p in enumerate(delivery_info['partner_history'], 1))
         
+        status_message = "".join(parts)
         await update.message.reply_markdown(status_message)
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get delivery status for order {order_name}: {e}")
 
 # ——— New Command Handlers —————————————————————————————————————————————
-async def bulk_set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
+def parse_sku_qty_pairs(args):
+    """Split /bulk_* arguments into [(sku, qty)] plus the SKUs whose
+    quantity isn't an integer. Returns None if args aren't SKU/qty pairs."""
     if len(args) < 2 or len(args) % 2 != 0:
-        return await update.message.reply_text("Usage: /bulk_set <SKU1> <qty1> <SKU2> <qty2> ...")
-    
-    results = []
-    for i in range(0, len(args), 2):
-        sku = args[i]
+        return None
+    pairs, bad = [], []
+    for sku, qty in zip(args[::2], args[1::2]):
         try:
-            qty = int(args[i + 1])
+            pairs.append((sku, int(qty)))
         except ValueError:
-            results.append(f"❌ {sku}: Invalid quantity")
-            continue
-        
-        try:
-            item_gid, loc_gid = graphql_get_item_and_location_ids(sku)
-            if not item_gid:
-                results.append(f"❌ {sku}: Variant not found")
-                continue
-            
-            current = get_product_by_sku(sku)["variants"][0]["inventory"]
-            _, errs = graphql_set_quantities(item_gid, loc_gid, qty)
-            if errs:
-                results.append(f"❌ {sku}: {errs[0]['message']}")
-            else:
-                results.append(f"✅ {sku}: {current} → {qty}")
-        except Exception as e:
-            results.append(f"❌ {sku}: {str(e)}")
+            bad.append(sku)
+    return pairs, bad
+
+async def _bulk_update(update: Update, pairs, bad, relative: bool):
+    """Shared body of /bulk_set and /bulk_return: one lookup query and one
+    mutation for the whole batch. Repeated SKUs apply in order. Nothing is
+    sent to Shopify unless every quantity parsed."""
+    if bad:
+        return await update.message.reply_text(
+            f"❌ Invalid quantity for: {', '.join(bad)}\nNo changes were made.")
     
-    await update.message.reply_text("\n".join(results))
+    pairs = [(i, sku, qty) for i, (sku, qty) in enumerate(pairs)]
+    results = {}
+    try:
+        loc_gid, found = await graphql_get_ids_and_inventory_many(sku for _, sku, _ in pairs)
+        new_qty = {}
+        lines = []
+        for i, sku, qty in pairs:
+            if sku not in found or not loc_gid:
+                results[i] = f"❌ {sku}: Variant not found"
+                continue
+            current = new_qty.get(sku, found[sku][1])
+            new_qty[sku] = current + qty if relative else qty
+            lines.append((i, sku, current, qty, new_qty[sku]))
+        
+        if new_qty:
+            entries = list(new_qty)
+            result, errs = await graphql_set_quantities_many(
+                loc_gid, [(found[sku][0], new_qty[sku]) for sku in entries])
+            # userErrors point at input.quantities.<n>; map them back to SKUs
+            sku_errors = {}
+            for err in (result or {}).get("userErrors") or []:
+                n = next((int(f) for f in err.get("field") or [] if str(f).isdigit()), None)
+                sku_errors[entries[n] if n is not None and n < len(entries) else None] = err["message"]
+            if sku_errors and not errs:
+                errs = [{"message": sku_errors.get(None, "Not applied (batch rejected)")}]
+            await invalidate_product(*entries)
+            for i, sku, current, qty, target in lines:
+                if errs:
+                    results[i] = f"❌ {sku}: {sku_errors.get(sku, errs[0]['message'])}"
+                elif relative:
+                    results[i] = f"✅ {sku}: +{qty} → {target}"
+                else:
+                    results[i] = f"✅ {sku}: {current} → {target}"
+    except Exception as e:
+        for i, sku, _ in pairs:
+            results.setdefault(i, f"❌ {sku}: {str(e)}")
+
+    await update.message.reply_text("\n".join(results[i] for i in sorted(results)))
+
+async def bulk_set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    parsed = parse_sku_qty_pairs(context.args)
+    if parsed is None:
+        return await update.message.reply_text("Usage: /bulk_set <SKU1> <qty1> <SKU2> <qty2> ...")
+    await _bulk_update(update, *parsed, relative=False)
 
 async def bulk_return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
-    if len(args) < 2 or len(args) % 2 != 0:
+    parsed = parse_sku_qty_pairs(context.args)
+    if parsed is None:
         return await update.message.reply_text("Usage: /bulk_return <SKU1> <qty1> <SKU2> <qty2> ...")
-    
-    results = []
-    for i in range(0, len(args), 2):
-        sku = args[i]
-        try:
-            qty = int(args[i + 1])
-        except ValueError:
-            results.append(f"❌ {sku}: Invalid quantity")
-            continue
-        
-        try:
-            item_gid, loc_gid = graphql_get_item_and_location_ids(sku)
-            if not item_gid:
-                results.append(f"❌ {sku}: Variant not found")
-                continue
-            
-            prod = get_product_by_sku(sku)
-            current = prod["variants"][0]["inventory"]
-            new_qty = current + qty
-            _, errs = graphql_set_quantities(item_gid, loc_gid, new_qty)
-            if errs:
-                results.append(f"❌ {sku}: {errs[0]['message']}")
-            else:
-                results.append(f"✅ {sku}: +{qty} → {new_qty}")
-        except Exception as e:
-            results.append(f"❌ {sku}: {str(e)}")
-    
-    await update.message.reply_text("\n".join(results))
+    await _bulk_update(update, *parsed, relative=True)
 
 async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
@@ -836,28 +1265,39 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Threshold must be a number.")
     
     # Verify SKU exists
-    prod = get_product_by_sku(sku)
-    if not prod:
+    try:
+        found = await get_product_inventory(sku)
+    except Exception as e:
+        return await update.message.reply_text(f"❌ Could not verify SKU {sku}: {e}")
+    if not found:
         return await update.message.reply_text(f"❌ SKU {sku} not found.")
     
-    alerts = get_inventory_alerts()
-    alerts[sku] = threshold
-    save_inventory_alerts(alerts)
+    set_inventory_alert(sku, threshold)
     
     await update.message.reply_text(f"✅ Alert set for {sku} at threshold {threshold}")
 
+# Per-line templates for the list-style replies below
+_LOW_STOCK_LINE = "• {sku}: {current} (threshold: {threshold})\n"
+_ORDER_LINE     = "• {name} - ₹{total_price} - {financial_status}\n"
+_UNITS_LINE     = "• {0}: {1} units\n"
+_RANKED_LINE    = "{0}. {1}: {2} units\n"
+_CUSTOMER_LINE  = "• {0} - {1}\n  Orders: {2} | Spent: ₹{3}\n\n"
+
 async def check_alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    low_stock_items = check_low_stock_alerts()
+    try:
+        low_stock_items = await check_low_stock_alerts()
+    except Exception as e:
+        return await update.message.reply_text(f"❌ Failed to check stock alerts: {e}")
     
     if not low_stock_items:
         await update.message.reply_text("✅ No low stock alerts")
         return
     
-    alert_message = "⚠️ *Low Stock Alerts:*\n\n"
+    parts = ["⚠️ *Low Stock Alerts:*\n\n"]
     for item in low_stock_items:
-        alert_message += f"• {item['sku']}: {item['current']} (threshold: {item['threshold']})\n"
+        parts.append(_LOW_STOCK_LINE.format_map(item))
     
-    await update.message.reply_markdown(alert_message)
+    await update.message.reply_markdown("".join(parts))
 
 async def order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
@@ -865,23 +1305,24 @@ async def order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Usage: /order <ORDER_ID>")
     
     order_name = args[0]
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
-        order_message = f"📦 *Order {order_name}*\n\n"
-        order_message += f"*Customer:* {order.get('email', 'N/A')}\n"
-        order_message += f"*Status:* {order.get('financial_status', 'N/A')}\n"
-        order_message += f"*Total:* ₹{order.get('total_price', '0')}\n"
-        order_message += f"*Created:* {order.get('created_at', 'N/A')[:10]}\n\n"
-        
-        order_message += "*Items:*\n"
+        parts = [
+            f"📦 *Order {order_name}*\n\n",
+            f"*Customer:* {order.get('email', 'N/A')}\n",
+            f"*Status:* {order.get('financial_status', 'N/A')}\n",
+            f"*Total:* ₹{order.get('total_price', '0')}\n",
+            f"*Created:* {order.get('created_at', 'N/A')[:10]}\n\n",
+            "*Items:*\n",
+        ]
         for item in order.get("line_items", []):
-            order_message += f"• {item.get('name', 'N/A')} (SKU: {item.get('sku', 'N/A')})\n"
-            order_message += f"  Qty: {item.get('quantity', 0)} | Price: ₹{item.get('price', '0')}\n"
+            parts.append(f"• {item.get('name', 'N/A')} (SKU: {item.get('sku', 'N/A')})\n")
+            parts.append(f"  Qty: {item.get('quantity', 0)} | Price: ₹{item.get('price', '0')}\n")
         
-        await update.message.reply_markdown(order_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get order details: {e}")
 
@@ -894,13 +1335,13 @@ async def orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         if filter_type == "pending":
-            orders = get_orders_by_status("open")
+            orders = await get_pending_orders()
             title = "📋 Pending Orders"
         elif filter_type == "today":
-            orders = get_orders_by_status("any", 1)
+            orders = await get_orders_by_status("any", 1)
             title = "📋 Today's Orders"
         elif filter_type == "week":
-            orders = get_orders_by_status("any", 7)
+            orders = await get_orders_by_status("any", 7)
             title = "📋 This Week's Orders"
         else:
             return await update.message.reply_text("Invalid filter. Use: pending, today, or week")
@@ -909,14 +1350,14 @@ async def orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"✅ No {filter_type} orders found")
             return
         
-        orders_message = f"{title}\n\n"
+        parts = [f"{title}\n\n"]
         for order in orders[:10]:  # Limit to 10 orders
-            orders_message += f"• {order.get('name', 'N/A')} - ₹{order.get('total_price', '0')} - {order.get('financial_status', 'N/A')}\n"
+            parts.append(_ORDER_LINE.format_map(order))
         
         if len(orders) > 10:
-            orders_message += f"\n... and {len(orders) - 10} more orders"
+            parts.append(f"\n... and {len(orders) - 10} more orders")
         
-        await update.message.reply_markdown(orders_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get orders: {e}")
 
@@ -928,15 +1369,16 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_name = args[0]
     reason = " ".join(args[1:])
     
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
         url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}/cancel.json"
         payload = {"reason": reason}
-        resp = requests.post(url, json=payload, headers=HEADERS)
+        resp = await shopify_rest("POST", url, json=payload)
         resp.raise_for_status()
+        _PENDING_CACHE.clear()
         
         await update.message.reply_text(f"✅ Order {order_name} cancelled\nReason: {reason}")
     except Exception as e:
@@ -953,7 +1395,7 @@ async def refund_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         return await update.message.reply_text("Amount must be a number.")
     
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
@@ -965,7 +1407,7 @@ async def refund_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "currency": "INR"
             }
         }
-        resp = requests.post(url, json=payload, headers=HEADERS)
+        resp = await shopify_rest("POST", url, json=payload)
         resp.raise_for_status()
         
         await update.message.reply_text(f"✅ Refund processed for {order_name}\nAmount: ₹{amount}")
@@ -992,30 +1434,31 @@ async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             days = 30
             title = "📊 Monthly Report"
         
-        orders = get_orders_by_status("any", days)
-        sales_data = get_sales_data(period)
+        orders = await get_orders_by_status("any", days)
+        sales_data = await get_sales_data(period)
         
-        report_message = f"{title}\n\n"
-        report_message += f"*Orders:* {len(orders)}\n"
-        report_message += f"*Total Sales:* ₹{sales_data['total_sales']:.2f}\n"
-        report_message += f"*Average Order Value:* ₹{sales_data['total_sales']/max(sales_data['total_orders'], 1):.2f}\n\n"
+        parts = [
+            f"{title}\n\n",
+            f"*Orders:* {len(orders)}\n",
+            f"*Total Sales:* ₹{sales_data['total_sales']:.2f}\n",
+            f"*Average Order Value:* ₹{sales_data['total_sales']/max(sales_data['total_orders'], 1):.2f}\n\n",
+        ]
         
         # Low stock items
-        low_stock_items = check_low_stock_alerts()
+        low_stock_items = await check_low_stock_alerts()
         if low_stock_items:
-            report_message += "*⚠️ Low Stock Items:*\n"
+            parts.append("*⚠️ Low Stock Items:*\n")
             for item in low_stock_items:
-                report_message += f"• {item['sku']}: {item['current']} (threshold: {item['threshold']})\n"
-            report_message += "\n"
+                parts.append(_LOW_STOCK_LINE.format_map(item))
+            parts.append("\n")
         
         # Top products
         if sales_data['products_sold']:
-            report_message += "*🏆 Top Products:*\n"
-            sorted_products = sorted(sales_data['products_sold'].items(), key=lambda x: x[1], reverse=True)
-            for sku, qty in sorted_products[:5]:
-                report_message += f"• {sku}: {qty} units\n"
+            parts.append("*🏆 Top Products:*\n")
+            for sku, qty in sales_data['products_sold'].most_common(5):
+                parts.append(_UNITS_LINE.format(sku, qty))
         
-        await update.message.reply_markdown(report_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to generate report: {e}")
 
@@ -1027,33 +1470,22 @@ async def hold_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_name = args[0]
     reason = " ".join(args[1:])
     
-    order = get_shopify_order_by_name(order_name)
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
-        url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}.json"
-        
-        # Add hold note to order
-        note = order.get("note", "")
+        # Add hold note and tag to order
         hold_note = f"\n--- ORDER ON HOLD ---\nReason: {reason}\nHeld on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        updated_note = note + hold_note if note else hold_note
-        
-        payload = {
-            "order": {
-                "id": order["id"],
-                "note": updated_note,
-                "tags": order.get("tags", "") + ", on-hold"
-            }
-        }
-        
-        resp = requests.put(url, json=payload, headers=HEADERS)
-        resp.raise_for_status()
+        await graphql_append_order_note(order, hold_note, extra_tags=["on-hold"])
         
         await update.message.reply_text(f"✅ Order {order_name} put on hold\nReason: {reason}")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to hold order: {e}")
 
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+TIME_RE = re.compile(r"\d{2}:\d{2}")
+
 async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if len(args) < 3:
@@ -1063,35 +1495,20 @@ async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date = args[1]
     time = args[2]
     
-    order = get_shopify_order_by_name(order_name)
+    # Validate date/time format (simple check) before hitting Shopify
+    if not DATE_RE.match(date):
+        return await update.message.reply_text("Invalid date format. Use YYYY-MM-DD")
+    if not TIME_RE.match(time):
+        return await update.message.reply_text("Invalid time format. Use HH:MM")
+    
+    order = await get_order(order_name, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_name} not found.")
     
     try:
-        # Validate date format (simple check)
-        if not re.match(r'\d{4}-\d{2}-\d{2}', date):
-            return await update.message.reply_text("Invalid date format. Use YYYY-MM-DD")
-        
-        # Validate time format (simple check)
-        if not re.match(r'\d{2}:\d{2}', time):
-            return await update.message.reply_text("Invalid time format. Use HH:MM")
-        
-        url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}.json"
-        
         # Add schedule note to order
-        note = order.get("note", "")
         schedule_note = f"\n--- DELIVERY SCHEDULED ---\nDate: {date}\nTime: {time}\nScheduled on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        updated_note = note + schedule_note if note else schedule_note
-        
-        payload = {
-            "order": {
-                "id": order["id"],
-                "note": updated_note
-            }
-        }
-        
-        resp = requests.put(url, json=payload, headers=HEADERS)
-        resp.raise_for_status()
+        await graphql_append_order_note(order, schedule_note)
         
         await update.message.reply_text(f"✅ Order {order_name} scheduled for delivery\nDate: {date}\nTime: {time}")
     except Exception as e:
@@ -1106,18 +1523,21 @@ async def track_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # This is a mock tracking response - in real implementation, you'd integrate with actual tracking APIs
-        track_message = f"📦 *Tracking Information*\n\n"
-        track_message += f"*Tracking ID:* {tracking_id}\n"
-        track_message += f"*Status:* In Transit\n"
-        track_message += f"*Carrier:* India Post Domestic\n"
-        track_message += f"*Last Update:* {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        track_message += f"*Estimated Delivery:* {datetime.now().strftime('%Y-%m-%d')}\n\n"
-        track_message += "*Tracking History:*\n"
-        track_message += "• Package picked up from warehouse\n"
-        track_message += "• In transit to destination\n"
-        track_message += "• Out for delivery\n"
-        
-        await update.message.reply_markdown(track_message)
+        now = datetime.now()
+        parts = [
+            "📦 *Tracking Information*\n\n",
+            f"*Tracking ID:* {tracking_id}\n",
+            "*Status:* In Transit\n",
+            "*Carrier:* India Post Domestic\n",
+            f"*Last Update:* {now.strftime('%Y-%m-%d %H:%M:%S')}\n",
+            f"*Estimated Delivery:* {now.strftime('%Y-%m-%d')}\n\n",
+            "*Tracking History:*\n",
+            "• Package picked up from warehouse\n",
+            "• In transit to destination\n",
+            "• Out for delivery\n",
+        ]
+        
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to track delivery: {e}")
 
@@ -1153,8 +1573,9 @@ async def product_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 }
             }
             
-            resp = requests.post(url, json=payload, headers=HEADERS)
+            resp = await shopify_rest("POST", url, json=payload)
             resp.raise_for_status()
+            await invalidate_product(sku)
             
             await update.message.reply_text(f"✅ Product added successfully\nSKU: {sku}\nName: {name}\nPrice: ₹{price}")
         
@@ -1162,25 +1583,31 @@ async def product_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if len(args) < 4:
                 return await update.message.reply_text("Usage: /product update <SKU> <field> <value>")
             
-            field = args[2]
-            value = args[3]
+            field = args[2].lower()
+            value = " ".join(args[3:])
+            if field != "price" and field not in PRODUCT_UPDATE_FIELDS:
+                return await update.message.reply_text(
+                    f"Invalid field. Use: {', '.join([*PRODUCT_UPDATE_FIELDS, 'price'])}")
             
-            # Get product by SKU first
-            prod = get_product_by_sku(sku)
-            if not prod:
+            variant = await graphql_find_variant(sku)
+            if not variant:
                 return await update.message.reply_text(f"❌ Product with SKU {sku} not found")
             
-            # Update product (simplified - would need product ID in real implementation)
+            await graphql_update_product(variant, field, value)
+            await invalidate_product(sku, *_product_skus(variant))
             await update.message.reply_text(f"✅ Product {sku} updated\nField: {field}\nValue: {value}")
         
         elif action == "delete":
-            # Get product by SKU first
-            prod = get_product_by_sku(sku)
-            if not prod:
+            variant = await graphql_find_variant(sku)
+            if not variant:
                 return await update.message.reply_text(f"❌ Product with SKU {sku} not found")
             
-            # Delete product (simplified - would need product ID in real implementation)
-            await update.message.reply_text(f"✅ Product {sku} deleted")
+            whole_product = await graphql_delete_variant(variant)
+            await invalidate_product(sku, *_product_skus(variant))
+            if whole_product:
+                await update.message.reply_text(f"✅ Product {sku} deleted")
+            else:
+                await update.message.reply_text(f"✅ Variant {sku} deleted; the product's other variants were kept")
         
         else:
             await update.message.reply_text("Invalid action. Use: add, update, or delete")
@@ -1196,27 +1623,14 @@ async def notify_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     order_id = args[0]
     message = " ".join(args[1:])
     
-    order = get_shopify_order_by_name(order_id)
+    order = await get_order(order_id, for_update=True, fields=ORDER_NOTE_FIELDS)
     if not order:
         return await update.message.reply_text(f"Order {order_id} not found.")
     
     try:
-        url = f"https://{STORE}/admin/api/{API_VER}/orders/{order['id']}.json"
-        
         # Add notification note to order
-        note = order.get("note", "")
         notify_note = f"\n--- CUSTOMER NOTIFICATION ---\nMessage: {message}\nSent on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        updated_note = note + notify_note if note else notify_note
-        
-        payload = {
-            "order": {
-                "id": order["id"],
-                "note": updated_note
-            }
-        }
-        
-        resp = requests.put(url, json=payload, headers=HEADERS)
-        resp.raise_for_status()
+        await graphql_append_order_note(order, notify_note)
         
         await update.message.reply_text(f"✅ Notification sent for order {order_id}\nMessage: {message}")
     except Exception as e:
@@ -1231,7 +1645,7 @@ async def autorestock_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Get auto restock settings
-        auto_restock_data = load_json_file(AUTO_RESTOCK_FILE)
+        auto_restock_data = load_json_file_cached(AUTO_RESTOCK_FILE)
         
         if sku in auto_restock_data:
             # Disable auto restock
@@ -1240,7 +1654,7 @@ async def autorestock_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.message.reply_text(f"✅ Auto restock disabled for {sku}")
         else:
             # Enable auto restock
-            prediction = predict_stock_needs(sku)
+            prediction = await predict_stock_needs(sku)
             if "error" in prediction:
                 await update.message.reply_text(f"❌ {prediction['error']}")
                 return
@@ -1260,18 +1674,18 @@ async def autorestock_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def autofulfill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         # Get auto fulfillment settings
-        auto_fulfill_data = load_json_file("auto_fulfill.json")
+        auto_fulfill_data = load_json_file_cached("auto_fulfill.json")
         
         if not auto_fulfill_data:
             await update.message.reply_text("📋 *Auto Fulfillment Rules*\n\nNo rules configured")
             return
         
-        rules_message = "📋 *Auto Fulfillment Rules*\n\n"
+        parts = ["📋 *Auto Fulfillment Rules*\n\n"]
         for rule_id, rule in auto_fulfill_data.items():
-            rules_message += f"• Rule {rule_id}: {rule.get('description', 'N/A')}\n"
-            rules_message += f"  Status: {'✅ Enabled' if rule.get('enabled') else '❌ Disabled'}\n\n"
+            parts.append(f"• Rule {rule_id}: {rule.get('description', 'N/A')}\n")
+            parts.append(f"  Status: {'✅ Enabled' if rule.get('enabled') else '❌ Disabled'}\n\n")
         
-        await update.message.reply_markdown(rules_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get auto fulfillment rules: {e}")
 
@@ -1282,16 +1696,18 @@ async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "timestamp": datetime.now().isoformat(),
             "inventory_alerts": get_inventory_alerts(),
             "support_tickets": get_support_tickets(),
-            "auto_restock": load_json_file(AUTO_RESTOCK_FILE),
+            "auto_restock": load_json_file_cached(AUTO_RESTOCK_FILE),
             "delivery_zones": DELIVERY_ZONES
         }
         
-        # Save backup to file
+        # Serialize once; the same bytes go to disk and to Telegram
         backup_filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        save_json_file(backup_filename, backup_data)
+        payload = orjson.dumps(backup_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        with open(backup_filename, 'wb') as f:
+            f.write(payload)
         
         # Send backup file
-        backup_file = io.BytesIO(json.dumps(backup_data, indent=2).encode())
+        backup_file = io.BytesIO(payload)
         backup_file.name = backup_filename
         
         await context.bot.send_document(
@@ -1312,7 +1728,7 @@ async def notifications_command(update: Update, context: ContextTypes.DEFAULT_TY
     action = args[0].lower()
     
     try:
-        notifications_data = load_json_file(NOTIFICATIONS_FILE)
+        notifications_data = load_json_file_cached(NOTIFICATIONS_FILE)
         
         if action == "on":
             if len(args) < 2:
@@ -1341,12 +1757,12 @@ async def notifications_command(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text(f"✅ {notification_type} notifications disabled")
         
         elif action == "status":
-            status_message = "🔔 *Notification Settings*\n\n"
+            parts = ["🔔 *Notification Settings*\n\n"]
             for notification_type in NOTIFICATION_TYPES:
                 status = notifications_data.get(notification_type, True)
-                status_message += f"• {notification_type}: {'✅ Enabled' if status else '❌ Disabled'}\n"
+                parts.append(f"• {notification_type}: {'✅ Enabled' if status else '❌ Disabled'}\n")
             
-            await update.message.reply_markdown(status_message)
+            await update.message.reply_markdown("".join(parts))
         
         else:
             await update.message.reply_text("Invalid action. Use: on, off, or status")
@@ -1364,41 +1780,43 @@ async def sales_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Invalid period. Use: today, week, or month")
     
     try:
-        sales_data = get_sales_data(period)
+        sales_data = await get_sales_data(period)
         
-        sales_message = f"📊 *Sales Report - {period.title()}*\n\n"
-        sales_message += f"*Total Sales:* ₹{sales_data['total_sales']:.2f}\n"
-        sales_message += f"*Total Orders:* {sales_data['total_orders']}\n"
-        sales_message += f"*Average Order Value:* ₹{sales_data['total_sales']/max(sales_data['total_orders'], 1):.2f}\n\n"
+        parts = [
+            f"📊 *Sales Report - {period.title()}*\n\n",
+            f"*Total Sales:* ₹{sales_data['total_sales']:.2f}\n",
+            f"*Total Orders:* {sales_data['total_orders']}\n",
+            f"*Average Order Value:* ₹{sales_data['total_sales']/max(sales_data['total_orders'], 1):.2f}\n\n",
+        ]
         
         if sales_data['products_sold']:
-            sales_message += "*Top Products:*\n"
-            sorted_products = sorted(sales_data['products_sold'].items(), key=lambda x: x[1], reverse=True)
-            for sku, qty in sorted_products[:5]:
-                sales_message += f"• {sku}: {qty} units\n"
+            parts.append("*Top Products:*\n")
+            for sku, qty in sales_data['products_sold'].most_common(5):
+                parts.append(_UNITS_LINE.format(sku, qty))
         
-        await update.message.reply_markdown(sales_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get sales data: {e}")
 
 async def top_products_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        sales_data = get_sales_data("month")
+        sales_data = await get_sales_data("month")
         
         if not sales_data['products_sold']:
             await update.message.reply_text("📊 No product sales data available")
             return
         
-        products_message = "🏆 *Top Selling Products (Last 30 Days)*\n\n"
-        sorted_products = sorted(sales_data['products_sold'].items(), key=lambda x: x[1], reverse=True)
+        parts = ["🏆 *Top Selling Products (Last 30 Days)*\n\n"]
         
-        for i, (sku, qty) in enumerate(sorted_products[:10], 1):
-            products_message += f"{i}. {sku}: {qty} units\n"
+        for i, (sku, qty) in enumerate(sales_data['products_sold'].most_common(10), 1):
+            parts.append(_RANKED_LINE.format(i, sku, qty))
         
-        await update.message.reply_markdown(products_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get top products: {e}")
 
+CUSTOMER_FIELDS = "first_name,last_name,email,phone,total_spent,orders_count,created_at"
+
 async def customer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if len(args) < 1:
@@ -1408,47 +1826,46 @@ async def customer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         url = f"https://{STORE}/admin/api/{API_VER}/customers/search.json"
-        params = {"query": email}
-        resp = requests.get(url, headers=HEADERS, params=params)
+        params = {"query": email, "fields": CUSTOMER_FIELDS}
+        resp = await shopify_rest("GET", url, params=params)
         resp.raise_for_status()
-        customers = resp.json().get("customers", [])
+        customers = orjson.loads(resp.content).get("customers", [])
         
         if not customers:
             await update.message.reply_text(f"❌ No customer found with email: {email}")
             return
         
         customer = customers[0]
-        customer_message = f"👤 *Customer Information*\n\n"
-        customer_message += f"*Name:* {customer.get('first_name', '')} {customer.get('last_name', '')}\n"
-        customer_message += f"*Email:* {customer.get('email', 'N/A')}\n"
-        customer_message += f"*Phone:* {customer.get('phone', 'N/A')}\n"
-        customer_message += f"*Total Spent:* ₹{customer.get('total_spent', '0')}\n"
-        customer_message += f"*Orders Count:* {customer.get('orders_count', 0)}\n"
-        customer_message += f"*Created:* {customer.get('created_at', 'N/A')[:10]}\n"
-        
-        await update.message.reply_markdown(customer_message)
+        parts = [
+            "👤 *Customer Information*\n\n",
+            f"*Name:* {customer.get('first_name', '')} {customer.get('last_name', '')}\n",
+            f"*Email:* {customer.get('email', 'N/A')}\n",
+            f"*Phone:* {customer.get('phone', 'N/A')}\n",
+            f"*Total Spent:* ₹{customer.get('total_spent', '0')}\n",
+            f"*Orders Count:* {customer.get('orders_count', 0)}\n",
+            f"*Created:* {customer.get('created_at', 'N/A')[:10]}\n",
+        ]
+        
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get customer info: {e}")
 
 async def customers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        url = f"https://{STORE}/admin/api/{API_VER}/customers.json"
-        params = {"limit": 10, "order": "created_at DESC"}
-        resp = requests.get(url, headers=HEADERS, params=params)
-        resp.raise_for_status()
-        customers = resp.json().get("customers", [])
+        customers = await graphql_recent_customers(10)
         
         if not customers:
             await update.message.reply_text("📊 No recent customers found")
             return
         
-        customers_message = "👥 *Recent Customers*\n\n"
+        parts = ["👥 *Recent Customers*\n\n"]
         for customer in customers:
-            name = f"{customer.get('first_name', '')} {customer.get('last_name', '')}".strip()
-            customers_message += f"• {name} - {customer.get('email', 'N/A')}\n"
-            customers_message += f"  Orders: {customer.get('orders_count', 0)} | Spent: ₹{customer.get('total_spent', '0')}\n\n"
+            name = f"{customer.get('firstName') or ''} {customer.get('lastName') or ''}".strip()
+            spent = (customer.get("amountSpent") or {}).get("amount", "0")
+            parts.append(_CUSTOMER_LINE.format(name, customer.get("email") or "N/A",
+                                               customer.get("numberOfOrders", 0), spent))
         
-        await update.message.reply_markdown(customers_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get customers: {e}")
 
@@ -1464,14 +1881,16 @@ async def support_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         ticket = create_support_ticket(order_id, description, user_id)
         
-        support_message = f"🎫 *Support Ticket Created*\n\n"
-        support_message += f"*Ticket ID:* {ticket['id']}\n"
-        support_message += f"*Order ID:* {ticket['order_id']}\n"
-        support_message += f"*Description:* {ticket['description']}\n"
-        support_message += f"*Status:* {ticket['status']}\n"
-        support_message += f"*Created:* {ticket['created_at'][:19]}\n"
+        parts = [
+            "🎫 *Support Ticket Created*\n\n",
+            f"*Ticket ID:* {ticket['id']}\n",
+            f"*Order ID:* {ticket['order_id']}\n",
+            f"*Description:* {ticket['description']}\n",
+            f"*Status:* {ticket['status']}\n",
+            f"*Created:* {ticket['created_at'][:19]}\n",
+        ]
         
-        await update.message.reply_markdown(support_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to create support ticket: {e}")
 
@@ -1486,13 +1905,15 @@ async def issue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         ticket = create_support_ticket("N/A", description, user_id)
         
-        issue_message = f"🐛 *Issue Reported*\n\n"
-        issue_message += f"*Ticket ID:* {ticket['id']}\n"
-        issue_message += f"*Description:* {ticket['description']}\n"
-        issue_message += f"*Status:* {ticket['status']}\n"
-        issue_message += f"*Created:* {ticket['created_at'][:19]}\n"
+        parts = [
+            "🐛 *Issue Reported*\n\n",
+            f"*Ticket ID:* {ticket['id']}\n",
+            f"*Description:* {ticket['description']}\n",
+            f"*Status:* {ticket['status']}\n",
+            f"*Created:* {ticket['created_at'][:19]}\n",
+        ]
         
-        await update.message.reply_markdown(issue_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to report issue: {e}")
 
@@ -1510,7 +1931,7 @@ async def discount_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await update.message.reply_text("Percentage must be a number")
     
     try:
-        result = apply_discount_to_order(order_id, percentage)
+        result = await apply_discount_to_order(order_id, percentage)
         if result:
             await update.message.reply_text(f"✅ Discount applied to {order_id}\nPercentage: {percentage}%")
         else:
@@ -1526,49 +1947,51 @@ async def predict_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sku = args[0]
     
     try:
-        prediction = predict_stock_needs(sku)
+        prediction = await predict_stock_needs(sku)
         
         if "error" in prediction:
             await update.message.reply_text(f"❌ {prediction['error']}")
             return
         
-        predict_message = f"🔮 *Stock Prediction for {sku}*\n\n"
-        predict_message += f"*Current Stock:* {prediction['current_stock']}\n"
-        predict_message += f"*Monthly Demand:* {prediction['monthly_demand']}\n"
-        predict_message += f"*Predicted Demand:* {prediction['predicted_demand']}\n"
-        predict_message += f"*Recommended Stock:* {prediction['recommended_stock']}\n"
-        predict_message += f"*Stock Needed:* {prediction['stock_needed']}\n"
+        parts = [
+            f"🔮 *Stock Prediction for {sku}*\n\n",
+            f"*Current Stock:* {prediction['current_stock']}\n",
+            f"*Monthly Demand:* {prediction['monthly_demand']}\n",
+            f"*Predicted Demand:* {prediction['predicted_demand']}\n",
+            f"*Recommended Stock:* {prediction['recommended_stock']}\n",
+            f"*Stock Needed:* {prediction['stock_needed']}\n",
+        ]
         
-        await update.message.reply_markdown(predict_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to predict stock needs: {e}")
 
 async def trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        sales_data = get_sales_data("month")
+        sales_data = await get_sales_data("month")
         
         if not sales_data['products_sold']:
             await update.message.reply_text("📈 No trend data available")
             return
         
-        trends_message = "📈 *Sales Trends (Last 30 Days)*\n\n"
-        
         # Calculate trends
         total_products = len(sales_data['products_sold'])
         total_units = sum(sales_data['products_sold'].values())
         avg_units_per_product = total_units / total_products if total_products > 0 else 0
         
-        trends_message += f"*Total Products Sold:* {total_products}\n"
-        trends_message += f"*Total Units Sold:* {total_units}\n"
-        trends_message += f"*Average Units per Product:* {avg_units_per_product:.1f}\n\n"
+        parts = [
+            "📈 *Sales Trends (Last 30 Days)*\n\n",
+            f"*Total Products Sold:* {total_products}\n",
+            f"*Total Units Sold:* {total_units}\n",
+            f"*Average Units per Product:* {avg_units_per_product:.1f}\n\n",
+        ]
         
         # Top performers
-        sorted_products = sorted(sales_data['products_sold'].items(), key=lambda x: x[1], reverse=True)
-        trends_message += "*🏆 Top Performers:*\n"
-        for sku, qty in sorted_products[:3]:
-            trends_message += f"• {sku}: {qty} units\n"
+        parts.append("*🏆 Top Performers:*\n")
+        for sku, qty in sales_data['products_sold'].most_common(3):
+            parts.append(_UNITS_LINE.format(sku, qty))
         
-        await update.message.reply_markdown(trends_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to get trends: {e}")
 
@@ -1582,19 +2005,21 @@ async def zone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         zone, delivery_time = get_delivery_zone(pincode)
         
-        zone_message = f"📍 *Delivery Zone Check*\n\n"
-        zone_message += f"*Pincode:* {pincode}\n"
-        zone_message += f"*Zone:* {zone}\n"
-        zone_message += f"*Delivery Time:* {delivery_time}\n"
+        parts = [
+            "📍 *Delivery Zone Check*\n\n",
+            f"*Pincode:* {pincode}\n",
+            f"*Zone:* {zone}\n",
+            f"*Delivery Time:* {delivery_time}\n",
+        ]
         
         if zone == "Not Available":
-            zone_message += "\n❌ *Delivery not available for this pincode*"
+            parts.append("\n❌ *Delivery not available for this pincode*")
         elif zone == "Invalid":
-            zone_message += "\n❌ *Invalid pincode format*"
+            parts.append("\n❌ *Invalid pincode format*")
         else:
-            zone_message += f"\n✅ *Delivery available*"
+            parts.append("\n✅ *Delivery available*")
         
-        await update.message.reply_markdown(zone_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to check delivery zone: {e}")
 
@@ -1606,26 +2031,41 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyword = " ".join(args)
     
     try:
-        results = search_products(keyword)
+        results = await search_products(keyword)
         
         if not results:
             await update.message.reply_text(f"🔍 No products found for: {keyword}")
             return
         
-        search_message = f"🔍 *Search Results for: {keyword}*\n\n"
+        parts = [f"🔍 *Search Results for: {keyword}*\n\n"]
         
         for i, product in enumerate(results[:5], 1):
-            search_message += f"{i}. *{product.get('title', 'N/A')}*\n"
-            search_message += f"   SKU: {product.get('variants', [{}])[0].get('sku', 'N/A')}\n"
-            search_message += f"   Price: ₹{product.get('variants', [{}])[0].get('price', '0')}\n\n"
+            variant = product["variants"][0]  # search_products always yields at least {}
+            parts.append(f"{i}. *{product['title']}*\n"
+                         f"   SKU: {variant.get('sku', 'N/A')}\n"
+                         f"   Price: ₹{variant.get('price', '0')}\n\n")
         
         if len(results) > 5:
-            search_message += f"... and {len(results) - 5} more products"
+            parts.append(f"... and {len(results) - 5} more products")
         
-        await update.message.reply_markdown(search_message)
+        await update.message.reply_markdown("".join(parts))
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to search products: {e}")
 
+def _csv_file(filename, header, rows):
+    """Write rows as UTF-8 CSV into a named BytesIO, rewound and ready to
+    upload. csv.writer handles quoting of commas/quotes in titles."""
+    buf = io.BytesIO()
+    buf.name = filename
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+    buf.seek(0)
+    return buf
+
 async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if len(args) < 1:
@@ -1635,19 +2075,16 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         if export_type == "inventory":
-            data = export_inventory_data()
+            data = await export_inventory_data()
             if not data:
                 await update.message.reply_text("❌ No inventory data to export")
                 return
             
-            # Create CSV content
-            csv_content = "SKU,Product,Variant,Price,Inventory,Status\n"
-            for row in data:
-                csv_content += f"{row['SKU']},{row['Product']},{row['Variant']},{row['Price']},{row['Inventory']},{row['Status']}\n"
+            columns = ("SKU", "Product", "Variant", "Price", "Inventory", "Status")
+            rows = ([row[c] for c in columns] for row in data)
             
             # Send as document
-            csv_file = io.BytesIO(csv_content.encode())
-            csv_file.name = f"inventory_export_{datetime.now().strftime('%Y%m%d')}.csv"
+            csv_file = _csv_file(f"inventory_export_{datetime.now().strftime('%Y%m%d')}.csv", columns, rows)
             
             await context.bot.send_document(
                 chat_id=update.effective_chat.id,
@@ -1656,20 +2093,19 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         
         elif export_type == "orders":
-            orders = get_orders_by_status("any", 30)  # Last 30 days
+            orders = await get_orders_by_status("any", 30)  # Last 30 days
             
             if not orders:
                 await update.message.reply_text("❌ No orders to export")
                 return
             
-            # Create CSV content
-            csv_content = "Order ID,Customer,Total,Status,Date\n"
-            for order in orders:
-                csv_content += f"{order.get('name', 'N/A')},{order.get('email', 'N/A')},{order.get('total_price', '0')},{order.get('financial_status', 'N/A')},{order.get('created_at', 'N/A')[:10]}\n"
+            rows = ((order.get('name', 'N/A'), order.get('email', 'N/A'), order.get('total_price', '0'),
+                     order.get('financial_status', 'N/A'), order.get('created_at', 'N/A')[:10])
+                    for order in orders)
             
             # Send as document
-            csv_file = io.BytesIO(csv_content.encode())
-            csv_file.name = f"orders_export_{datetime.now().strftime('%Y%m%d')}.csv"
+            csv_file = _csv_file(f"orders_export_{datetime.now().strftime('%Y%m%d')}.csv",
+                                 ("Order ID", "Customer", "Total", "Status", "Date"), rows)
             
             await context.bot.send_document(
                 chat_id=update.effective_chat.id,
@@ -1683,149 +2119,346 @@ async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to export data: {e}")
 
+# Menus never change, so their markup is built once; PTB telegram objects are frozen.
+QUICK_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📦 Check Alerts", callback_data="check_alerts"),
+        InlineKeyboardButton("📋 Pending Orders", callback_data="pending_orders")
+    ],
+    [
+        InlineKeyboardButton("📊 Sales Today", callback_data="sales_today"),
+        InlineKeyboardButton("🔍 Search Products", callback_data="search_products")
+    ],
+    [
+        InlineKeyboardButton("🚚 Delivery Status", callback_data="delivery_status"),
+        InlineKeyboardButton("👥 Recent Customers", callback_data="recent_customers")
+    ],
+    [
+        InlineKeyboardButton("📈 Trends", callback_data="trends"),
+        InlineKeyboardButton("🎫 Support Tickets", callback_data="support_tickets")
+    ],
+    [
+        InlineKeyboardButton("❌ Close", callback_data="close_menu")
+    ]
+])
+
 async def quick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Quick actions menu with interactive buttons"""
-    keyboard = [
-        [
-            InlineKeyboardButton("📦 Check Alerts", callback_data="check_alerts"),
-            InlineKeyboardButton("📋 Pending Orders", callback_data="pending_orders")
-        ],
-        [
-            InlineKeyboardButton("📊 Sales Today", callback_data="sales_today"),
-            InlineKeyboardButton("🔍 Search Products", callback_data="search_products")
-        ],
-        [
-            InlineKeyboardButton("🚚 Delivery Status", callback_data="delivery_status"),
-            InlineKeyboardButton("👥 Recent Customers", callback_data="recent_customers")
-        ],
-        [
-            InlineKeyboardButton("📈 Trends", callback_data="trends"),
-            InlineKeyboardButton("🎫 Support Tickets", callback_data="support_tickets")
-        ],
-        [
-            InlineKeyboardButton("❌ Close", callback_data="close_menu")
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(
         "🚀 *Quick Actions Menu*\n\nSelect an action:",
-        reply_markup=reply_markup,
+        reply_markup=QUICK_MENU_MARKUP,
         parse_mode="Markdown"
     )
 
+async def _quick_check_alerts(query):
+    try:
+        low_stock_items = await check_low_stock_alerts()
+    except Exception as e:
+        return await query.edit_message_text(f"❌ Failed to check stock alerts: {e}")
+    if not low_stock_items:
+        return await query.edit_message_text("✅ No low stock alerts")
+    parts = ["⚠️ *Low Stock Alerts:*\n\n"]
+    parts.extend(_LOW_STOCK_LINE.format_map(item) for item in low_stock_items)
+    await query.edit_message_text("".join(parts), parse_mode="Markdown")
+
+async def _quick_pending_orders(query):
+    orders = await get_pending_orders()
+    if not orders:
+        return await query.edit_message_text("✅ No pending orders")
+    parts = ["📋 *Pending Orders*\n\n"]
+    parts.extend(f"• {order.get('name', 'N/A')} - ₹{order.get('total_price', '0')}\n" for order in orders[:5])
+    await query.edit_message_text("".join(parts), parse_mode="Markdown")
+
+async def _quick_sales_today(query):
+    sales_data = await get_sales_data("today")
+    sales_message = f"📊 *Today's Sales*\n\n*Total:* ₹{sales_data['total_sales']:.2f}\n*Orders:* {sales_data['total_orders']}"
+    await query.edit_message_text(sales_message, parse_mode="Markdown")
+
+async def _quick_close_menu(query):
+    await query.edit_message_text("👋 Menu closed")
+
+# callback_data -> action; the handler pattern is built from the same keys
+QUICK_ACTIONS = {
+    "check_alerts":   _quick_check_alerts,
+    "pending_orders": _quick_pending_orders,
+    "sales_today":    _quick_sales_today,
+    "close_menu":     _quick_close_menu,
+}
+QUICK_RE = re.compile("^(?:%s)$" % "|".join(map(re.escape, QUICK_ACTIONS)), re.ASCII)
+
 async def quick_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle quick action callbacks"""
     query = update.callback_query
     await query.answer()
-    
-    if query.data == "check_alerts":
-        low_stock_items = check_low_stock_alerts()
-        if not low_stock_items:
-            await query.edit_message_text("✅ No low stock alerts")
-        else:
-            alert_message = "⚠️ *Low Stock Alerts:*\n\n"
-            for item in low_stock_items:
-                alert_message += f"• {item['sku']}: {item['current']} (threshold: {item['threshold']})\n"
-            await query.edit_message_text(alert_message, parse_mode="Markdown")
-    
-    elif query.data == "pending_orders":
-        orders = get_orders_by_status("open")
-        if not orders:
-            await query.edit_message_text("✅ No pending orders")
-        else:
-            orders_message = "📋 *Pending Orders*\n\n"
-            for order in orders[:5]:
-                orders_message += f"• {order.get('name', 'N/A')} - ₹{order.get('total_price', '0')}\n"
-            await query.edit_message_text(orders_message, parse_mode="Markdown")
-    
-    elif query.data == "sales_today":
-        sales_data = get_sales_data("today")
-        sales_message = f"📊 *Today's Sales*\n\n*Total:* ₹{sales_data['total_sales']:.2f}\n*Orders:* {sales_data['total_orders']}"
-        await query.edit_message_text(sales_message, parse_mode="Markdown")
-    
-    elif query.data == "close_menu":
-        await query.edit_message_text("👋 Menu closed")
+    await QUICK_ACTIONS[query.data](query)
 
 # ——— Shopify/Inventory logic —————————————————————————————————————————————
-def graphql_get_item_and_location_ids(sku: str):
-    query = """
-    query($sku:String!){
-      productVariants(first:1,query:$sku){edges{node{inventoryItem{id}}}}
-      locations(first:1){edges{node{id}}}
-    }
+# Primary location GID. Fetched on first use, then dropped from lookup queries.
+_LOCATION_GID = None
+
+_Q_GET_IDS = """
+query($sku:String!){
+  productVariants(first:1,query:$sku){edges{node{inventoryItem{id}}}}
+}
+"""
+_Q_GET_IDS_WITH_LOCATION = """
+query($sku:String!){
+  productVariants(first:1,query:$sku){edges{node{inventoryItem{id}}}}
+  locations(first:1){edges{node{id}}}
+}
+"""
+_Q_IDS_AND_INVENTORY = """
+query($sku:String!){
+  productVariants(first:1,query:$sku){edges{node{sku inventoryQuantity inventoryItem{id}}}}
+}
+"""
+_Q_IDS_AND_INVENTORY_WITH_LOCATION = """
+query($sku:String!){
+  productVariants(first:1,query:$sku){edges{node{sku inventoryQuantity inventoryItem{id}}}}
+  locations(first:1){edges{node{id}}}
+}
+"""
+_Q_SET_QTY = """
+mutation($in:InventorySetQuantitiesInput!){
+  inventorySetQuantities(input:$in){
+    inventoryAdjustmentGroup{changes{name delta}}
+    userErrors{field message}
+  }
+}
+"""
+_Q_PRODUCT_INVENTORY = """
+query($sku:String!){
+  products(first:1,query:$sku){edges{node{variants(first:1){edges{node{sku inventoryQuantity}}}}}}
+}
+"""
+# Product card for handle_sku; only the first image is ever sent.
+_PRODUCT_FIELDS = """
+edges{node{
+  title description onlineStoreUrl
+  images(first:1){edges{node{url(transform:{maxWidth:1024,preferredContentType:JPG})}}}
+  variants(first:5){edges{node{sku title price inventoryQuantity}}}
+}}
+"""
+
+@functools.lru_cache(maxsize=64)
+def _q_ids_and_inventory(n, with_location):
+    """Aliased `productVariants` lookup for `n` SKUs, one exact match per alias."""
+    params = ",".join(f"$s{i}:String!" for i in range(n))
+    fields = "".join(f"v{i}:productVariants(first:1,query:$s{i})"
+                     "{edges{node{sku inventoryQuantity inventoryItem{id}}}}"
+                     for i in range(n))
+    if with_location:
+        fields += "locations(first:1){edges{node{id}}}"
+    return f"query({params}){{{fields}}}"
+
+@functools.lru_cache(maxsize=32)
+def _q_products(n):
+    """Aliased `products` lookup for `n` SKUs; built once per batch size."""
+    params = ",".join(f"$s{i}:String!" for i in range(n))
+    fields = "".join(f"p{i}:products(first:1,query:$s{i}){{{_PRODUCT_FIELDS}}}"
+                     for i in range(n))
+    return f"query({params}){{{fields}}}"
+
+class CostBucket:
+    """Client-side mirror of Shopify's GraphQL leaky bucket.
+
+    Shopify admits a query only when `currentlyAvailable` covers its
+    *requested* cost, then refunds whatever the query didn't actually use.
+    The bucket does the same: acquire() reserves the last requestedQueryCost
+    seen for the query (waiting for a refill if needed) and update() settles
+    the reservation against the response's `throttleStatus`.
     """
-    resp = requests.post(GRAPHQL_URL,
-                         json={"query": query, "variables": {"sku": sku}},
-                         headers=HEADERS)
-    resp.raise_for_status()
-    data = resp.json()
+
+    def __init__(self, capacity=1000.0, restore_rate=50.0):
+        self.capacity = capacity
+        self.restore_rate = restore_rate
+        self.available = capacity
+        self.updated = None
+        self._requested = {}
+        self._in_flight = 0
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.restore_rate)
+        self.updated = now
+
+    async def acquire(self, query):
+        """Reserve the query's requested cost; returns the amount reserved."""
+        loop = asyncio.get_running_loop()
+        cost = min(self._requested.get(query, 10), self.capacity)
+        self._refill(loop.time())
+        self.available -= cost
+        self._in_flight += cost
+        if self.available < 0:
+            await asyncio.sleep(-self.available / self.restore_rate)
+        return cost
+
+    def update(self, query, body, reserved):
+        """Settle a reservation once the response (or failure) is in."""
+        self._in_flight -= reserved
+        cost = (body.get("extensions") or {}).get("cost")
+        if not cost:
+            return
+        self._requested[query] = cost.get("requestedQueryCost") or reserved
+        status = cost.get("throttleStatus")
+        if status:
+            # The server's figure already includes the refund of
+            # requested - actual; keep other in-flight reservations held.
+            self.capacity = status["maximumAvailable"]
+            self.restore_rate = status["restoreRate"]
+            self.available = status["currentlyAvailable"] - self._in_flight
+            self.updated = asyncio.get_running_loop().time()
+        elif cost.get("actualQueryCost") is not None:
+            self.available += reserved - cost["actualQueryCost"]
+
+    def throttle_wait(self, body):
+        """Seconds until a THROTTLED query's requested cost is available again,
+        or None if the response wasn't throttled."""
+        if not any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in body.get("errors") or []):
+            return None
+        cost = (body.get("extensions") or {}).get("cost") or {}
+        status = cost.get("throttleStatus") or {}
+        deficit = (cost.get("requestedQueryCost") or 0) - status.get("currentlyAvailable", 0)
+        return max(deficit, 0) / (status.get("restoreRate") or self.restore_rate)
+
+GRAPHQL_BUDGET = CostBucket()
+
+async def _graphql_post(query, variables):
+    """POST one GraphQL document to Shopify and return the decoded JSON body.
+    A THROTTLED response is retried once, after waiting out the deficit."""
+    for attempt in range(2):
+        reserved = await GRAPHQL_BUDGET.acquire(query)
+        body = {}
+        try:
+            resp = await HTTP_CLIENT.post(GRAPHQL_URL,
+                                          content=orjson.dumps({"query": query, "variables": variables}),
+                                          headers=HEADERS)
+            resp.raise_for_status()
+            body = orjson.loads(resp.content)
+        finally:
+            GRAPHQL_BUDGET.update(query, body, reserved)
+        wait = GRAPHQL_BUDGET.throttle_wait(body)
+        if wait is None or attempt:
+            return body
+        logger.info("Shopify GraphQL throttled; retrying in %.1fs", wait)
+        await asyncio.sleep(wait)
+
+# Store currency is static; fetched once at startup instead of per product lookup.
+CURRENCY = None
+SYMBOL = ""
+
+async def load_shop_currency():
+    global CURRENCY, SYMBOL
+    data = await _graphql_post("{shop{currencyCode}}", {})
+    CURRENCY = data["data"]["shop"]["currencyCode"]
+    SYMBOL = CURRENCY_SYMBOLS.get(CURRENCY, CURRENCY + " ")
+
+def _location_from(data):
+    """Return the cached location GID, populating it from `data` on first use."""
+    global _LOCATION_GID
+    if _LOCATION_GID is None:
+        loc = data["data"].get("locations", {}).get("edges")
+        if loc:
+            _LOCATION_GID = loc[0]["node"]["id"]
+    return _LOCATION_GID
+
+# A variant's inventory item GID never changes; keep it for an hour.
+_GID_CACHE = TTLCache(maxsize=1024, ttl=3600)
+
+async def graphql_get_item_and_location_ids(sku: str):
+    item_gid = _GID_CACHE.get(sku) or await shared_cache_get(f"gid:{sku}")
+    if item_gid and _LOCATION_GID:
+        _GID_CACHE[sku] = item_gid
+        return item_gid, _LOCATION_GID
+    query = _Q_GET_IDS if _LOCATION_GID else _Q_GET_IDS_WITH_LOCATION
+    data = await _graphql_post(query, {"sku": sku})
     if data.get("errors"):
         logger.error("GraphQL get IDs errors: %s", data["errors"])
         return None, None
     pv = data["data"]["productVariants"]["edges"]
-    loc = data["data"]["locations"]["edges"]
-    if not pv or not loc:
+    loc_gid = _location_from(data)
+    if not pv or not loc_gid:
         return None, None
-    return pv[0]["node"]["inventoryItem"]["id"], loc[0]["node"]["id"]
-
-def graphql_set_quantities(item_gid: str, loc_gid: str, qty: int):
-    mutation = """
-    mutation($in:InventorySetQuantitiesInput!){
-      inventorySetQuantities(input:$in){
-        inventoryAdjustmentGroup{changes{name delta}}
-        userErrors{field message}
-      }
-    }
+    item_gid = _GID_CACHE[sku] = pv[0]["node"]["inventoryItem"]["id"]
+    await shared_cache_set(f"gid:{sku}", item_gid, 3600)
+    return item_gid, loc_gid
+
+async def graphql_get_ids_and_inventory(sku: str):
+    """Fetch inventory item GID, location GID and current stock in one round-trip."""
+    query = _Q_IDS_AND_INVENTORY if _LOCATION_GID else _Q_IDS_AND_INVENTORY_WITH_LOCATION
+    data = await _graphql_post(query, {"sku": sku})
+    if data.get("errors"):
+        logger.error("GraphQL get IDs/inventory errors: %s", data["errors"])
+        return None, None, None
+    pv = data["data"]["productVariants"]["edges"]
+    loc_gid = _location_from(data)
+    if not pv or not loc_gid:
+        return None, None, None
+    node = pv[0]["node"]
+    return node["inventoryItem"]["id"], loc_gid, node["inventoryQuantity"]
+
+_BATCH_LOOKUP_SIZE = 100  # aliases per query; keeps each request well under the cost cap
+
+async def _get_ids_and_inventory_batch(skus):
+    query = _q_ids_and_inventory(len(skus), _LOCATION_GID is None)
+    data = await _graphql_post(query, {f"s{i}": 'sku:"%s"' % sku.replace('"', "")
+                                       for i, sku in enumerate(skus)})
+    if data.get("errors"):
+        # Raise rather than return {}: an empty result would read as "no such SKU"
+        logger.error("GraphQL get IDs/inventory (batch) errors: %s", data["errors"])
+        raise RuntimeError(f"Inventory lookup failed: {data['errors'][0].get('message')}")
+    found = {}
+    for i, sku in enumerate(skus):
+        edges = data["data"][f"v{i}"]["edges"]
+        if edges:
+            node = edges[0]["node"]
+            found[sku] = (node["inventoryItem"]["id"], node["inventoryQuantity"])
+    _location_from(data)
+    return found
+
+async def graphql_get_ids_and_inventory_many(skus):
+    """Resolve several SKUs, 100 per query, with the queries issued concurrently.
+
+    Returns (location GID, {sku: (inventory item GID, current stock)}); SKUs
+    that don't exist are simply missing from the dict. Raises RuntimeError if
+    any batch query fails, so a failed lookup is never mistaken for "not found".
     """
-    payload = {
-        "query": mutation,
-        "variables": {
-            "in": {
-                "name": "available",
-                "reason": "other",
-                "ignoreCompareQuantity": True,
-                "quantities": [{
-                    "inventoryItemId": item_gid,
-                    "locationId":       loc_gid,
-                    "quantity":         qty
-                }]
-            }
+    skus = list(dict.fromkeys(skus))
+    if not skus:
+        return _LOCATION_GID, {}
+    chunks = [skus[i:i + _BATCH_LOOKUP_SIZE] for i in range(0, len(skus), _BATCH_LOOKUP_SIZE)]
+    found = {}
+    for part in await asyncio.gather(*(_get_ids_and_inventory_batch(c) for c in chunks)):
+        found.update(part)
+    return _LOCATION_GID, found
+
+async def graphql_set_quantities_many(loc_gid: str, quantities):
+    """Set `available` for several (item GID, qty) pairs in one mutation."""
+    data = await _graphql_post(_Q_SET_QTY, {
+        "in": {
+            "name": "available",
+            "reason": "other",
+            "ignoreCompareQuantity": True,
+            "quantities": [{
+                "inventoryItemId": item_gid,
+                "locationId":       loc_gid,
+                "quantity":         qty
+            } for item_gid, qty in quantities]
         }
-    }
-    resp = requests.post(GRAPHQL_URL, json=payload, headers=HEADERS)
-    resp.raise_for_status()
-    data = resp.json()
+    })
+    invalidate_low_stock()
     if data.get("errors"):
         return None, data["errors"]
     return data["data"].get("inventorySetQuantities"), None
 
-def get_product_by_sku(sku: str):
-    query = """
-    query($sku:String!){
-      shop{currencyCode}
-      products(first:1,query:$sku){
-        edges{node{
-          title description onlineStoreUrl
-          images(first:5){edges{node{src}}}
-          variants(first:5){edges{node{sku title price inventoryQuantity}}}
-        }}
-      }
-    }
-    """
-    resp = requests.post(GRAPHQL_URL,
-                         json={"query": query, "variables": {"sku": sku}},
-                         headers=HEADERS)
-    resp.raise_for_status()
-    data = resp.json()
-    if data.get("errors"):
-        logger.error("GraphQL getProduct errors: %s", data["errors"])
-        return None
-    edges = data["data"]["products"]["edges"]
+async def graphql_set_quantities(item_gid: str, loc_gid: str, qty: int):
+    return await graphql_set_quantities_many(loc_gid, [(item_gid, qty)])
+
+def _product_from_edges(edges):
     if not edges:
         return None
     n = edges[0]["node"]
-    images = [i["node"]["src"] for i in n["images"]["edges"]]
+    images = [i["node"]["url"] for i in n["images"]["edges"]]
     variants = [
         {
             "sku":       v["node"]["sku"],
@@ -1841,31 +2474,262 @@ def get_product_by_sku(sku: str):
         "url":         n["onlineStoreUrl"],
         "images":      images,
         "variants":    variants,
-        "currency":    data["data"]["shop"]["currencyCode"],
     }
 
+async def graphql_get_products_by_skus(skus):
+    """Look up several SKUs in one document using aliased `products` fields."""
+    variables = {f"s{i}": sku for i, sku in enumerate(skus)}
+    data = await _graphql_post(_q_products(len(skus)), variables)
+    if data.get("errors"):
+        # Raise so SkuBatcher fails every waiter instead of answering "no such SKU"
+        logger.error("GraphQL getProduct errors: %s", data["errors"])
+        raise RuntimeError(f"Product lookup failed: {data['errors'][0].get('message')}")
+    return {sku: _product_from_edges(data["data"][f"p{i}"]["edges"])
+            for i, sku in enumerate(skus)}
+
+class SkuBatcher:
+    """DataLoader-style coalescer: SKU lookups arriving within `window` seconds
+    are sent to Shopify as a single aliased GraphQL query."""
+
+    def __init__(self, window=0.01, max_batch=25):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def load(self, sku):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((sku, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        skus = list(dict.fromkeys(sku for sku, _ in batch))
+        try:
+            results = await graphql_get_products_by_skus(skus)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for sku, fut in batch:
+            if not fut.done():
+                fut.set_result(results.get(sku))
+
+SKU_LOADER = SkuBatcher()
+
+# Recently fetched products; repeat scans of the same SKU skip Shopify entirely.
+_PROD_CACHE = TTLCache(maxsize=4096, ttl=30)
+_PROD_INFLIGHT = {}
+
+async def get_product_by_sku(sku: str):
+    prod = _PROD_CACHE.get(sku)
+    if prod is not None:
+        return prod
+    prod = await shared_cache_get(f"prod:{sku}")
+    if prod is not None:
+        _PROD_CACHE[sku] = prod
+        return prod
+    # Single-flight: concurrent misses for one SKU share a single lookup.
+    fut = _PROD_INFLIGHT.get(sku)
+    if fut is None:
+        fut = asyncio.ensure_future(SKU_LOADER.load(sku))
+        _PROD_INFLIGHT[sku] = fut
+        fut.add_done_callback(lambda _: _PROD_INFLIGHT.pop(sku, None))
+    prod = await asyncio.shield(fut)
+    if prod is not None:
+        _PROD_CACHE[sku] = prod
+        await shared_cache_set(f"prod:{sku}", prod, 30)
+    return prod
+
+async def get_product_inventory(sku: str):
+    """First variant's SKU and stock, without the product card fields."""
+    data = await _graphql_post(_Q_PRODUCT_INVENTORY, {"sku": sku})
+    if data.get("errors"):
+        logger.error("GraphQL getProductInventory errors: %s", data["errors"])
+        raise RuntimeError(f"Inventory lookup failed: {data['errors'][0].get('message')}")
+    edges = data["data"]["products"]["edges"]
+    if not edges or not edges[0]["node"]["variants"]["edges"]:
+        return None
+    v = edges[0]["node"]["variants"]["edges"][0]["node"]
+    return {"sku": v["sku"], "inventory": v["inventoryQuantity"]}
+
+async def invalidate_product(*skus: str):
+    """Drop cached products after their inventory changed."""
+    for sku in skus:
+        _PROD_CACHE.pop(sku, None)
+    _SEARCH_CACHE.clear()
+    await shared_cache_delete(*(f"prod:{sku}" for sku in skus))
+
+# /product update and delete re-resolve the SKU fresh (never from the product
+# cache) and only act on a variant whose sku matches exactly; a free-text
+# products query can match another product's title or description.
+_Q_VARIANT_BY_SKU = """
+query($q:String!){
+  productVariants(first:10,query:$q){edges{node{
+    id sku
+    product{id variantsCount{count} variants(first:50){edges{node{sku}}}}
+  }}}
+}
+"""
+_Q_PRODUCT_UPDATE = """
+mutation($product:ProductUpdateInput!){
+  productUpdate(product:$product){product{id} userErrors{field message}}
+}
+"""
+_Q_VARIANT_UPDATE = """
+mutation($pid:ID!,$variants:[ProductVariantsBulkInput!]!){
+  productVariantsBulkUpdate(productId:$pid,variants:$variants){userErrors{field message}}
+}
+"""
+_Q_VARIANT_DELETE = """
+mutation($pid:ID!,$ids:[ID!]!){
+  productVariantsBulkDelete(productId:$pid,variantsIds:$ids){product{id} userErrors{field message}}
+}
+"""
+_Q_PRODUCT_DELETE = """
+mutation($id:ID!){
+  productDelete(input:{id:$id}){deletedProductId userErrors{field message}}
+}
+"""
+# /product update <field> -> ProductUpdateInput key ("price" goes to the variant)
+PRODUCT_UPDATE_FIELDS = {
+    "title":       "title",
+    "description": "descriptionHtml",
+    "vendor":      "vendor",
+    "type":        "productType",
+    "tags":        "tags",
+    "status":      "status",
+}
+
+async def _graphql_mutation(query, variables, root):
+    """Run a mutation and raise on top-level or user errors."""
+    data = await _graphql_post(query, variables)
+    errs = data.get("errors") or data["data"][root]["userErrors"]
+    if errs:
+        logger.error("Shopify %s errors: %s", root, errs)
+        raise Exception(errs[0]["message"])
+    return data["data"][root]
+
+async def graphql_find_variant(sku):
+    """Uncached lookup of the variant whose SKU is exactly `sku`, or None."""
+    q = 'sku:"%s"' % sku.replace("\\", "\\\\").replace('"', '\\"')
+    data = await _graphql_post(_Q_VARIANT_BY_SKU, {"q": q})
+    if data.get("errors"):
+        raise RuntimeError(data["errors"])
+    return next((e["node"] for e in data["data"]["productVariants"]["edges"]
+                 if e["node"]["sku"] == sku), None)
+
+def _product_skus(variant):
+    """Every SKU on the variant's product, for cache invalidation."""
+    return [e["node"]["sku"] for e in variant["product"]["variants"]["edges"] if e["node"]["sku"]]
+
+async def graphql_update_product(variant, field, value):
+    """Set one field on the variant's product (price goes to the variant itself)."""
+    if field == "price":
+        return await _graphql_mutation(_Q_VARIANT_UPDATE, {
+            "pid": variant["product"]["id"], "variants": [{"id": variant["id"], "price": value}]
+        }, "productVariantsBulkUpdate")
+    if field == "tags":
+        value = [t.strip() for t in value.split(",") if t.strip()]
+    elif field == "status":
+        value = value.upper()
+    return await _graphql_mutation(_Q_PRODUCT_UPDATE, {
+        "product": {"id": variant["product"]["id"], PRODUCT_UPDATE_FIELDS[field]: value}
+    }, "productUpdate")
+
+async def graphql_delete_variant(variant):
+    """Delete just this variant, or the whole product if it is the last one
+    (Shopify products can't exist without a variant). Returns True when the
+    product itself was deleted."""
+    product = variant["product"]
+    whole_product = product["variantsCount"]["count"] <= 1
+    if whole_product:
+        await _graphql_mutation(_Q_PRODUCT_DELETE, {"id": product["id"]}, "productDelete")
+        skus = _product_skus(variant)
+    else:
+        await _graphql_mutation(_Q_VARIANT_DELETE, {"pid": product["id"], "ids": [variant["id"]]},
+                                "productVariantsBulkDelete")
+        skus = [variant["sku"]]
+    # Forget the deleted inventory items' cached ids
+    for sku in skus:
+        _GID_CACHE.pop(sku, None)
+    await shared_cache_delete(*(f"gid:{sku}" for sku in skus))
+    return whole_product
+
+async def _download_to_buffer(url, timeout=10):
+    """Stream `url` into a BytesIO without an intermediate full-body bytes copy.
+    Returns (buffer, content type)."""
+    buf = io.BytesIO()
+    async with HTTP_CLIENT.stream("GET", url, timeout=timeout) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_bytes():
+            buf.write(chunk)
+    buf.seek(0)
+    return buf, r.headers.get("content-type", "")
+
 async def safe_send_photo(chat_id, bot, url, caption=None, parse_mode=None):
     try:
         await bot.send_photo(chat_id, url, caption=caption, parse_mode=parse_mode)
         return
     except BadRequest:
         logger.warning("send_photo URL failed, falling back…")
-    # Re-encode if needed
+    # Retry with the CDN-resized variant before touching the bytes ourselves
+    small_url = str(httpx.URL(url).copy_set_param("width", 1024))
+    if small_url != url:
+        try:
+            await bot.send_photo(chat_id, small_url, caption=caption, parse_mode=parse_mode)
+            return
+        except BadRequest:
+            logger.warning("send_photo resized URL failed, falling back…")
+    # Upload as-is when the image is small enough; re-encode only if needed
+    raw = None
+    try:
+        # One streamed GET gives both the bytes and the headers; no HEAD first
+        raw, content_type = await _download_to_buffer(url)
+        size = raw.getbuffer().nbytes
+        if content_type.startswith("image/") and 0 < size <= 5 * 1024 * 1024:
+            raw.name = "image.jpg"
+            await bot.send_photo(chat_id, raw, caption=caption, parse_mode=parse_mode)
+            return
+    except Exception as e1:
+        logger.warning("Direct upload failed: %s", e1)
     try:
-        r = requests.get(url, timeout=10); r.raise_for_status()
-        img = Image.open(io.BytesIO(r.content)).convert("RGB")
-        if max(img.size) > 1024:
-            img.thumbnail((1024, 1024), Image.LANCZOS)
-        buf = io.BytesIO(); img.save(buf, "JPEG", quality=85)
+        if raw is None:
+            raw, _ = await _download_to_buffer(url)
+        raw.seek(0)
+        from PIL import Image
+        buf = io.BytesIO()
+        with Image.open(raw) as src:
+            src.draft("RGB", (1024, 1024))  # JPEG: let libjpeg downscale during decode
+            with src.convert("RGB") as img:
+                if max(img.size) > 1024:
+                    img.thumbnail((1024, 1024), Image.BILINEAR)
+                img.save(buf, "JPEG", quality=85, optimize=False, progressive=False, subsampling=2)
         buf.name = "image.jpg"; buf.seek(0)
         await bot.send_photo(chat_id, buf, caption=caption, parse_mode=parse_mode)
         return
     except Exception as e2:
         logger.warning("Re-encode failed: %s", e2)
-    # Last fallback: document
+    # Last fallback: document (reuse the bytes already downloaded above)
     try:
-        r = requests.get(url, timeout=10); r.raise_for_status()
-        doc = io.BytesIO(r.content); doc.name = "file"; doc.seek(0)
+        doc = raw if raw is not None else (await _download_to_buffer(url))[0]
+        doc.name = "file"; doc.seek(0)
         await bot.send_document(chat_id, document=doc, caption=caption, parse_mode=parse_mode)
         return
     except Exception as e3:
@@ -1874,20 +2738,34 @@ async def safe_send_photo(chat_id, bot, url, caption=None, parse_mode=None):
         await bot.send_message(chat_id, caption, parse_mode=parse_mode)
 
 # ——— Handlers —————————————————————————————————————————————————————
+_BACKGROUND_TASKS = set()
+
+def _discard_task(task):
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.debug("Background task failed: %s", task.exception())
+
+def send_typing(bot, chat_id):
+    """Show the typing indicator without waiting on Telegram's reply."""
+    task = asyncio.create_task(bot.send_chat_action(chat_id, ChatAction.TYPING))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_discard_task)
+
+START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Cargos", url=f"{CUSTOM_DOMAIN}/collections/cargos"),
+     InlineKeyboardButton("Jeans",  url=f"{CUSTOM_DOMAIN}/collections/jeans"),
+     InlineKeyboardButton("All",    url=f"{CUSTOM_DOMAIN}/collections/all")],
+    [InlineKeyboardButton("Quit", callback_data="quit")],
+])
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    kb = [
-        [InlineKeyboardButton("Cargos", url=f"{CUSTOM_DOMAIN}/collections/cargos"),
-         InlineKeyboardButton("Jeans",  url=f"{CUSTOM_DOMAIN}/collections/jeans"),
-         InlineKeyboardButton("All",    url=f"{CUSTOM_DOMAIN}/collections/all")],
-        [InlineKeyboardButton("Quit", callback_data="quit")],
-    ]
-    await update.message.reply_text("👋 Welcome! /help for commands.", reply_markup=InlineKeyboardMarkup(kb))
+    await update.message.reply_text("👋 Welcome! /help for commands.", reply_markup=START_MARKUP)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(COMMANDS_TEXT)
 
 async def qrtest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if zbar_decode:
+    if QR_ENABLED:
         await update.message.reply_text("📷 QR/barcode scanning ENABLED!")
     else:
         await update.message.reply_text("📷 QR/barcode scanning DISABLED.")
@@ -1895,6 +2773,13 @@ async def qrtest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def privacy_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(PRIVACY_POLICY)
 
+async def refreshloc_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global _LOCATION_GID
+    _LOCATION_GID = None
+    await update.message.reply_text("📍 Location cache cleared; it will be re-fetched on next use.")
+
+QUIT_RE = re.compile(r"^quit$", re.ASCII)
+
 async def quit_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -1903,17 +2788,21 @@ async def quit_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_sku(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sku = update.message.text.strip()
-    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
-    prod = get_product_by_sku(sku)
+    send_typing(context.bot, update.effective_chat.id)
+    try:
+        prod = await get_product_by_sku(sku)
+    except Exception as e:
+        return await update.message.reply_text(f"❌ Could not look up {sku}: {e}")
     if not prod:
         return await update.message.reply_markdown(f"❌ No product for SKU `{sku}`")
-    sym = CURRENCY_SYMBOLS.get(prod["currency"], prod["currency"]+" ")
-    lines = [f"*{prod['title']}*",
-             f"[View]({prod['url']})","", prod["description"],"",
-             "*Variants & Inventory:*"]
-    for v in prod["variants"]:
-        lines.append(f"• `{v['sku']}` — {v['title']} — {sym}{v['price']} — stock: {v['inventory']}")
-    caption = "\n".join(lines)
+    if CURRENCY is None:
+        await load_shop_currency()
+    sym = SYMBOL
+    variants_block = "\n".join(
+        f"• `{v['sku']}` — {v['title']} — {sym}{v['price']} — stock: {v['inventory']}"
+        for v in prod["variants"])
+    caption = (f"*{prod['title']}*\n[View]({prod['url']})\n\n{prod['description']}\n\n"
+               f"*Variants & Inventory:*\n{variants_block}")
     if prod["images"]:
         await safe_send_photo(update.effective_chat.id, context.bot, prod["images"][0],
                               caption=caption, parse_mode="Markdown")
@@ -1929,14 +2818,14 @@ async def set_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         qty = int(qty_str)
     except ValueError:
         return await update.message.reply_text("Qty must be a number.")
-    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
-    item_gid, loc_gid = graphql_get_item_and_location_ids(sku)
+    send_typing(context.bot, update.effective_chat.id)
+    item_gid, loc_gid, current = await graphql_get_ids_and_inventory(sku)
     if not item_gid:
         return await update.message.reply_markdown("❌ Variant/location not found.")
-    current = get_product_by_sku(sku)["variants"][0]["inventory"]
-    _, errs = graphql_set_quantities(item_gid, loc_gid, qty)
+    _, errs = await graphql_set_quantities(item_gid, loc_gid, qty)
     if errs:
         return await update.message.reply_markdown(f"❌ {errs[0]['message']}")
+    await invalidate_product(sku)
     await update.message.reply_markdown(f"✅ Stock for `{sku}` set {current} → {qty}")
 
 async def return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1948,31 +2837,73 @@ async def return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         qty = int(qty_str)
     except ValueError:
         return await update.message.reply_text("Qty must be a number.")
-    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
-    item_gid, loc_gid = graphql_get_item_and_location_ids(sku)
+    send_typing(context.bot, update.effective_chat.id)
+    item_gid, loc_gid, current = await graphql_get_ids_and_inventory(sku)
     if not item_gid:
         return await update.message.reply_markdown("❌ Variant/location not found.")
-    prod = get_product_by_sku(sku)
-    current = prod["variants"][0]["inventory"]
     new_qty = current + qty
-    _, errs = graphql_set_quantities(item_gid, loc_gid, new_qty)
+    _, errs = await graphql_set_quantities(item_gid, loc_gid, new_qty)
     if errs:
         return await update.message.reply_markdown(f"❌ {errs[0]['message']}")
+    await invalidate_product(sku)
     await update.message.reply_markdown(f"✅ Return: `{sku}` +{qty} → {new_qty}")
 
+# QR/barcodes stay decodable well below full photo resolution.
+QR_MIN_EDGE = 640
+QR_MAX_EDGE = 1024
+QR_FORMATS = ("JPEG", "PNG", "WEBP")
+
+def _pick_qr_photo(photos):
+    """Smallest Telegram photo size whose long edge is still >= QR_MIN_EDGE."""
+    for p in photos:
+        if max(p.width, p.height) >= QR_MIN_EDGE:
+            return p
+    return photos[-1]
+
+_QR_DECODE = None
+
+def _qr_decoder():
+    """Import the QR backend on first use; returns decode(img) -> list of strings."""
+    global _QR_DECODE
+    if _QR_DECODE is None:
+        if QR_BACKEND == "zxingcpp":
+            import zxingcpp
+            formats = (zxingcpp.BarcodeFormat.QRCode, zxingcpp.BarcodeFormat.Code128)
+            _QR_DECODE = lambda img: [r.text for r in zxingcpp.read_barcodes(img, formats=formats)]
+        else:
+            from pyzbar.pyzbar import decode, ZBarSymbol
+            symbols = [ZBarSymbol.QRCODE, ZBarSymbol.CODE128]
+            _QR_DECODE = lambda img: [c.data.decode() for c in decode(img, symbols=symbols)]
+    return _QR_DECODE
+
+def _decode_qr(buf):
+    # Runs in a worker thread: Pillow and zbar release the GIL while decoding.
+    from PIL import Image
+    decode = _qr_decoder()
+    img = Image.open(buf, formats=QR_FORMATS)  # skip probing every other Pillow plugin
+    img.draft("L", (QR_MAX_EDGE, QR_MAX_EDGE))  # JPEG: decode as grayscale at 1/2–1/8 scale
+    img.thumbnail((QR_MAX_EDGE, QR_MAX_EDGE), Image.BILINEAR)
+    img = img.convert("L")
+    return decode(img)
+
 async def photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not zbar_decode:
+    if not QR_ENABLED:
         return await update.message.reply_text(
-            "📷 QR/barcode scanning DISABLED. Install zbar + pyzbar + pillow."
+            "📷 QR/barcode scanning DISABLED. Install zxing-cpp (or zbar + pyzbar) and pillow."
         )
-    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
-    file = await update.message.photo[-1].get_file()
-    data = await file.download_as_bytearray()
-    img = Image.open(io.BytesIO(data))
-    codes = zbar_decode(img)
+    send_typing(context.bot, update.effective_chat.id)
+    file = await _pick_qr_photo(update.message.photo).get_file()
+    buf = io.BytesIO()
+    await file.download_to_memory(buf)
+    buf.seek(0)
+    try:
+        codes = await asyncio.to_thread(_decode_qr, buf)
+    except ImportError as e:
+        logger.warning("QR backend failed to load: %s", e)
+        return await update.message.reply_text("📷 QR/barcode scanning unavailable on this server.")
     if not codes:
         return await update.message.reply_text("❌ No QR/barcode detected.")
-    payload = codes[0].data.decode().strip()
+    payload = codes[0].strip()
     if "," in payload:
         sku, qty_str = payload.split(",", 1)
         if qty_str.isdigit():
@@ -1996,72 +2927,151 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(update, "message") and update.message:
         await update.message.reply_text("❌ Something went wrong.")
 
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
-    
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different chats concurrently, so a slow Shopify
+    call in one chat doesn't hold up everyone else, while keeping updates
+    from the same chat in arrival order.
+    """
+
+    def __init__(self, max_concurrent_updates=64):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+        self._pending = Counter()
+
+    async def process_update(self, update, coroutine):
+        # Wait for this chat's turn *before* the base class takes one of the
+        # max_concurrent_updates slots, so a backlog in one chat can't hold
+        # slots every other chat needs.
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        key = chat.id
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] += 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key], self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def post_init(app):
+    try:
+        await load_shop_currency()
+    except Exception as e:
+        logger.warning("Could not fetch shop currency at startup: %s", e)
+
+async def post_shutdown(app):
+    await HTTP_CLIENT.aclose()
+    if REDIS is not None:
+        await REDIS.aclose()
+
+# /command -> handler. Registered through a single CommandHandler, so each
+# update is matched with one set lookup instead of a scan over every handler.
+COMMANDS = {
     # ——— Basic Commands —————————————————————————————————————————————
-    app.add_handler(CommandHandler("start",       start))
-    app.add_handler(CommandHandler("help",        help_command))
-    app.add_handler(CommandHandler("qrtest",      qrtest_command))
-    app.add_handler(CommandHandler("privacy",     privacy_command))
-    
+    "start":         start,
+    "help":          help_command,
+    "qrtest":        qrtest_command,
+    "privacy":       privacy_command,
+
     # ——— Inventory Management —————————————————————————————————————————————
-    app.add_handler(CommandHandler("set",    set_command))
-    app.add_handler(CommandHandler("return",      return_command))
-    app.add_handler(CommandHandler("bulk_set", bulk_set_command))
-    app.add_handler(CommandHandler("bulk_return", bulk_return_command))
-    app.add_handler(CommandHandler("alert", alert_command))
-    app.add_handler(CommandHandler("check_alerts", check_alerts_command))
-    
+    "set":           set_command,
+    "return":        return_command,
+    "bulk_set":      bulk_set_command,
+    "bulk_return":   bulk_return_command,
+    "alert":         alert_command,
+    "check_alerts":  check_alerts_command,
+    "refreshloc":    refreshloc_command,
+
     # ——— Order Management —————————————————————————————————————————————
-    app.add_handler(CommandHandler("order", order_command))
-    app.add_handler(CommandHandler("orders", orders_command))
-    app.add_handler(CommandHandler("cancel", cancel_command))
-    app.add_handler(CommandHandler("refund", refund_command))
-    app.add_handler(CommandHandler("hold", hold_command))
-    app.add_handler(CommandHandler("schedule", schedule_command))
-    app.add_handler(CommandHandler("track", track_command))
-    
+    "order":         order_command,
+    "orders":        orders_command,
+    "cancel":        cancel_command,
+    "refund":        refund_command,
+    "hold":          hold_command,
+    "schedule":      schedule_command,
+    "track":         track_command,
+
     # ——— Delivery Management —————————————————————————————————————————————
-    app.add_handler(CommandHandler("checktracking", checktracking_command))
-    app.add_handler(CommandHandler("fulfill", fulfill_command))
-    app.add_handler(CommandHandler("reschedule", reschedule_command))
-    app.add_handler(CommandHandler("partner", partner_command))
-    app.add_handler(CommandHandler("status", status_command))
-    app.add_handler(CommandHandler("zone", zone_command))
-    
+    "checktracking": checktracking_command,
+    "fulfill":       fulfill_command,
+    "reschedule":    reschedule_command,
+    "partner":       partner_command,
+    "status":        status_command,
+    "zone":          zone_command,
+
     # ——— Analytics & Reports —————————————————————————————————————————————
-    app.add_handler(CommandHandler("sales", sales_command))
-    app.add_handler(CommandHandler("top_products", top_products_command))
-    app.add_handler(CommandHandler("customer", customer_command))
-    app.add_handler(CommandHandler("customers", customers_command))
-    app.add_handler(CommandHandler("report", report_command))
-    
+    "sales":         sales_command,
+    "top_products":  top_products_command,
+    "customer":      customer_command,
+    "customers":     customers_command,
+    "report":        report_command,
+
     # ——— Customer Service —————————————————————————————————————————————
-    app.add_handler(CommandHandler("support", support_command))
-    app.add_handler(CommandHandler("issue", issue_command))
-    app.add_handler(CommandHandler("notify", notify_command))
-    
+    "support":       support_command,
+    "issue":         issue_command,
+    "notify":        notify_command,
+
     # ——— Product Management —————————————————————————————————————————————
-    app.add_handler(CommandHandler("discount", discount_command))
-    app.add_handler(CommandHandler("product", product_command))
-    
+    "discount":      discount_command,
+    "product":       product_command,
+
     # ——— Smart Features —————————————————————————————————————————————
-    app.add_handler(CommandHandler("predict", predict_command))
-    app.add_handler(CommandHandler("trends", trends_command))
-    app.add_handler(CommandHandler("autorestock", autorestock_command))
-    app.add_handler(CommandHandler("autofulfill", autofulfill_command))
-    
+    "predict":       predict_command,
+    "trends":        trends_command,
+    "autorestock":   autorestock_command,
+    "autofulfill":   autofulfill_command,
+
     # ——— System Features —————————————————————————————————————————————
-    app.add_handler(CommandHandler("search", search_command))
-    app.add_handler(CommandHandler("export", export_command))
-    app.add_handler(CommandHandler("quick", quick_command))
-    app.add_handler(CommandHandler("backup", backup_command))
-    app.add_handler(CommandHandler("notifications", notifications_command))
+    "search":        search_command,
+    "export":        export_command,
+    "quick":         quick_command,
+    "backup":        backup_command,
+    "notifications": notifications_command,
+}
+
+async def dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    name = update.effective_message.text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+    await COMMANDS[name](update, context)
+
+def main():
+    # HTTP/2 lets concurrent Bot API calls share one multiplexed connection.
+    request = HTTPXRequest(connection_pool_size=64, pool_timeout=20, http_version="2",
+                           read_timeout=30, connect_timeout=10)
+    updates_request = HTTPXRequest(http_version="2", read_timeout=30, connect_timeout=10)
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .request(request)
+        .get_updates_request(updates_request)
+        .concurrent_updates(PerChatUpdateProcessor())
+        # Every Bot API call is queued under Telegram's ~30 msg/s global and
+        # per-group caps; RetryAfter responses are retried, not surfaced.
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1, max_retries=3))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    
+    # ——— Commands —————————————————————————————————————————————
+    app.add_handler(CommandHandler(COMMANDS, dispatch_command))
     
     # ——— Callback Handlers —————————————————————————————————————————————
-    app.add_handler(CallbackQueryHandler(quit_callback, pattern="quit"))
-    app.add_handler(CallbackQueryHandler(quick_callback, pattern="^(check_alerts|pending_orders|sales_today|close_menu)$"))
+    app.add_handler(CallbackQueryHandler(quit_callback, pattern=QUIT_RE))
+    app.add_handler(CallbackQueryHandler(quick_callback, pattern=QUICK_RE))
     
     # ——— Message Handlers —————————————————————————————————————————————
     app.add_handler(MessageHandler(filters.PHOTO,           photo_handler))
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# bot.py reads its configuration at import time.
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+os.environ.setdefault("SHOPIFY_STORE", "test.myshopify.com")
+os.environ.setdefault("SHOPIFY_ADMIN_TOKEN", "test")
+os.environ.pop("REDIS_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
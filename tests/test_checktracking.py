@@ -0,0 +1,69 @@
+"""/checktracking: rows for the same order never run concurrently."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import bot
+
+
+def test_rows_for_one_order_run_sequentially(monkeypatch):
+    rows = [("T1", "#1001", "PACKED"), ("T2", "1001", "PACKED"), ("T3", "1002", "PACKED"), ("T4", "", "")]
+    monkeypatch.setattr(bot, "new_tracking_rows", lambda validators: rows)
+    monkeypatch.setattr(bot, "save_processed_ids", lambda ids: None)
+    monkeypatch.setattr(bot, "save_csv_validators", lambda validators: None)
+
+    async def fake_get_order(order_name, for_update=False, fields=None):
+        return {"id": order_name.lstrip("#"), "name": order_name}
+
+    active, peak, calls = {}, {}, []
+
+    async def fake_add_tracking(order, tracking_id):
+        key = order["id"]
+        active[key] = active.get(key, 0) + 1
+        peak[key] = max(peak.get(key, 0), active[key])
+        calls.append(tracking_id)
+        await asyncio.sleep(0.01)
+        active[key] -= 1
+
+    monkeypatch.setattr(bot, "get_order", fake_get_order)
+    monkeypatch.setattr(bot, "add_tracking_to_order", fake_add_tracking)
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+    asyncio.run(bot._checktracking(update, SimpleNamespace(args=[])))
+
+    assert peak == {"1001": 1, "1002": 1}
+    assert calls.index("T1") < calls.index("T2")
+    # Orders still overlap: 1002 starts before 1001's second row.
+    assert calls.index("T3") < calls.index("T2")
+    lines = update.message.reply_text.call_args[0][0].splitlines()
+    assert [line.split(":")[0] for line in lines] == ["Order #1001", "Order 1001", "Order 1002", "Tracking ID T4"]
+
+
+def test_failed_order_is_reported_after_others_finish(monkeypatch):
+    rows = [("T1", "1001", "PACKED"), ("T2", "1001", "PACKED"), ("T3", "1002", "PACKED")]
+    saved, validators_saved = [], []
+    monkeypatch.setattr(bot, "new_tracking_rows", lambda validators: rows)
+    monkeypatch.setattr(bot, "save_processed_ids", saved.extend)
+    monkeypatch.setattr(bot, "save_csv_validators", validators_saved.append)
+
+    async def fake_get_order(order_name, for_update=False, fields=None):
+        if order_name == "1001":
+            raise RuntimeError("Shopify 502")
+        await asyncio.sleep(0.01)  # still running when 1001 fails
+        return {"id": order_name}
+
+    added = []
+
+    async def fake_add_tracking(order, tracking_id):
+        added.append(tracking_id)
+
+    monkeypatch.setattr(bot, "get_order", fake_get_order)
+    monkeypatch.setattr(bot, "add_tracking_to_order", fake_add_tracking)
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+    asyncio.run(bot._checktracking(update, SimpleNamespace(args=[])))
+
+    lines = update.message.reply_text.call_args[0][0].splitlines()
+    assert lines[0] == "Tracking ID T1: Failed (Shopify 502); 2 row(s) for order 1001 will be retried next run."
+    assert lines[1].startswith("Order 1002: Tracking ID T3")
+    assert added == ["T3"]
+    assert saved == ["T3"]
+    assert validators_saved == []
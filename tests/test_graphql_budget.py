@@ -0,0 +1,74 @@
+"""CostBucket reserves requested cost and _graphql_post retries THROTTLED once."""
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+import bot
+
+
+def _cost(requested, actual, available, restore=50.0):
+    return {"cost": {"requestedQueryCost": requested, "actualQueryCost": actual,
+                     "throttleStatus": {"maximumAvailable": 1000.0, "currentlyAvailable": available,
+                                        "restoreRate": restore}}}
+
+
+THROTTLED = {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+             "extensions": _cost(800, None, 300)}
+OK = {"data": {"shop": {"name": "x"}}, "extensions": _cost(800, 120, 380)}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record sleeps instead of waiting; the bucket refills as if time had passed."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+        if bot.GRAPHQL_BUDGET.updated is not None:
+            bot.GRAPHQL_BUDGET.updated -= delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(bot.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+@pytest.fixture
+def budget(monkeypatch, sleeps):
+    bucket = bot.CostBucket()
+    monkeypatch.setattr(bot, "GRAPHQL_BUDGET", bucket)
+    return bucket
+
+
+def test_acquire_reserves_requested_not_actual_cost(budget, sleeps):
+    async def scenario():
+        reserved = await budget.acquire("Q")
+        budget.update("Q", OK, reserved)
+        assert budget.available == 380
+        assert await budget.acquire("Q") == 800  # not the 120 it actually cost
+        assert budget._in_flight == 800
+        assert sleeps == [pytest.approx((800 - 380) / 50.0)]
+
+    asyncio.run(scenario())
+
+
+def test_throttled_query_is_retried_once_after_deficit(budget, sleeps, monkeypatch):
+    responses = [THROTTLED, OK]
+
+    def handler(request):
+        return httpx.Response(200, content=orjson.dumps(responses.pop(0)))
+
+    monkeypatch.setattr(bot, "HTTP_CLIENT", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    body = asyncio.run(bot._graphql_post("Q", {}))
+    assert body["data"] == {"shop": {"name": "x"}}
+    assert sleeps[0] == pytest.approx((800 - 300) / 50.0)
+    assert budget._in_flight == 0
+
+
+def test_second_throttle_is_returned_to_caller(budget, monkeypatch):
+    monkeypatch.setattr(bot, "HTTP_CLIENT", httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=orjson.dumps(THROTTLED)))))
+    body = asyncio.run(bot._graphql_post("Q", {}))
+    assert body["errors"][0]["extensions"]["code"] == "THROTTLED"
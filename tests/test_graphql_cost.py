@@ -0,0 +1,94 @@
+"""Static checks that bulk GraphQL documents stay under Shopify's per-query cost cap."""
+import asyncio
+import re
+
+import pytest
+
+import bot
+
+MAX_QUERY_COST = 1000
+_TOKEN_RE = re.compile(r"\.\.\.\s*\w+|\w+|\([^)]*\)|[{}]")
+_FRAGMENT_RE = re.compile(r"fragment\s+(\w+)\s+on\s+\w+\s*{")
+
+
+def _inline_fragments(query):
+    """Return the operation with every `...Name` spread replaced by its fragment body."""
+    fragments, spans = {}, []
+    for m in _FRAGMENT_RE.finditer(query):
+        depth, i = 1, m.end()
+        while depth:
+            depth += {"{": 1, "}": -1}.get(query[i], 0)
+            i += 1
+        fragments[m.group(1)] = query[m.end():i - 1]
+        spans.append((m.start(), i))
+    for start, end in reversed(spans):
+        query = query[:start] + query[end:]
+    for name, selection in fragments.items():
+        query = re.sub(r"\.\.\.\s*%s\b" % name, lambda _: selection, query)
+    return query
+
+
+# Connection wrappers Shopify doesn't bill as objects of their own
+_FREE_FIELDS = {"edges", "pageInfo"}
+
+
+def _selection_cost(tokens, i):
+    """Cost of the selection set whose first field is tokens[i]; returns (cost, index after '}').
+
+    Mirrors Shopify's requested-cost rules: a connection costs
+    2 + first × (cost of one node), every other object 1, scalars 0.
+    """
+    cost = 0
+    while tokens[i] != "}":
+        name, first = tokens[i], None
+        i += 1
+        if tokens[i].startswith("("):
+            m = re.search(r"\bfirst\s*:\s*(\d+)", tokens[i])
+            first = int(m.group(1)) if m else None
+            i += 1
+        if tokens[i] == "{":
+            child, i = _selection_cost(tokens, i + 1)
+            if first:
+                cost += 2 + first * child
+            elif name in _FREE_FIELDS:
+                cost += child
+            else:
+                cost += 1 + child
+    return cost, i + 1
+
+
+def requested_cost(query):
+    tokens = _TOKEN_RE.findall(_inline_fragments(query))
+    start = tokens.index("{")
+    cost, _ = _selection_cost(tokens, start + 1)
+    return cost
+
+
+def test_estimator_flags_oversized_pages():
+    assert requested_cost("{ orders(first:250){edges{node{ lineItems(first:50){edges{node{sku}}} }}} }") > MAX_QUERY_COST
+
+
+@pytest.mark.parametrize("name", ["_Q_ORDERS", "_Q_EXPORT_INVENTORY", "_Q_VARIANT_BY_SKU", "_Q_SEARCH_PRODUCTS"])
+def test_bulk_queries_stay_under_cost_limit(name):
+    assert requested_cost(getattr(bot, name)) < MAX_QUERY_COST
+
+
+def test_export_inventory_follows_cursor(monkeypatch):
+    pages = [
+        {"edges": [{"node": {"sku": "A", "title": "S", "price": "1", "inventoryQuantity": 3,
+                             "product": {"title": "Tee", "status": "ACTIVE"}}}],
+         "pageInfo": {"hasNextPage": True, "endCursor": "c1"}},
+        {"edges": [{"node": {"sku": "B", "title": "M", "price": "2", "inventoryQuantity": 0,
+                             "product": {"title": "Tee", "status": "DRAFT"}}}],
+         "pageInfo": {"hasNextPage": False, "endCursor": "c2"}},
+    ]
+    seen = []
+
+    async def fake_post(query, variables):
+        seen.append(variables["after"])
+        return {"data": {"productVariants": pages[len(seen) - 1]}}
+
+    monkeypatch.setattr(bot, "_graphql_post", fake_post)
+    rows = asyncio.run(bot.export_inventory_data())
+    assert seen == [None, "c1"]
+    assert [(r["SKU"], r["Status"]) for r in rows] == [("A", "Active"), ("B", "Inactive")]
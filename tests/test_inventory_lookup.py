@@ -0,0 +1,49 @@
+"""Batch inventory lookups must tell "lookup failed" apart from "SKU not found"."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def graphql_errors(monkeypatch):
+    async def fake_post(query, variables):
+        return {"errors": [{"message": "Throttled"}]}
+
+    monkeypatch.setattr(bot, "_LOCATION_GID", "gid://loc/1")
+    monkeypatch.setattr(bot, "_graphql_post", fake_post)
+
+
+def test_batch_lookup_raises_on_graphql_errors(graphql_errors):
+    with pytest.raises(RuntimeError, match="Throttled"):
+        asyncio.run(bot.graphql_get_ids_and_inventory_many(["A", "B"]))
+
+
+def test_bulk_update_reports_failed_lookup(graphql_errors):
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+    asyncio.run(bot._bulk_update(update, [("A", 1), ("B", 2)], [], relative=False))
+    reply = update.message.reply_text.call_args[0][0]
+    assert "not found" not in reply
+    assert reply.splitlines() == ["❌ A: Inventory lookup failed: Throttled",
+                                  "❌ B: Inventory lookup failed: Throttled"]
+
+
+def test_failed_lookup_is_not_cached_as_no_alerts(graphql_errors, monkeypatch):
+    monkeypatch.setattr(bot, "get_inventory_alerts", lambda: {"A": 5})
+    bot.invalidate_low_stock()
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+    asyncio.run(bot.check_alerts_command(update, SimpleNamespace(args=[])))
+    assert update.message.reply_text.call_args[0][0].startswith("❌ Failed to check stock alerts")
+    assert "items" not in bot._LOW_STOCK_CACHE
+
+    async def recovered(query, variables):
+        return {"data": {"v0": {"edges": [{"node": {
+            "sku": "A", "inventoryQuantity": 2, "inventoryItem": {"id": "gid://item/1"}}}]}}}
+
+    monkeypatch.setattr(bot, "_graphql_post", recovered)
+    items = asyncio.run(bot.check_low_stock_alerts())
+    assert items == [{"sku": "A", "current": 2, "threshold": 5}]
+    bot.invalidate_low_stock()
@@ -0,0 +1,62 @@
+"""/product update and delete must only ever touch an exact SKU match."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import bot
+
+
+def _variant(sku, vid="gid://v/1", pid="gid://p/1", siblings=()):
+    skus = [sku, *siblings]
+    return {"node": {"id": vid, "sku": sku, "product": {
+        "id": pid, "variantsCount": {"count": len(skus)},
+        "variants": {"edges": [{"node": {"sku": s}} for s in skus]}}}}
+
+
+def _run(monkeypatch, args, edges):
+    posts = []
+
+    async def fake_post(query, variables):
+        posts.append((query, variables))
+        if query is bot._Q_VARIANT_BY_SKU:
+            return {"data": {"productVariants": {"edges": edges}}}
+        root = {bot._Q_PRODUCT_DELETE: "productDelete",
+                bot._Q_VARIANT_DELETE: "productVariantsBulkDelete"}.get(query, "productVariantsBulkUpdate")
+        return {"data": {root: {"userErrors": []}}}
+
+    monkeypatch.setattr(bot, "_graphql_post", fake_post)
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+    asyncio.run(bot.product_command(update, SimpleNamespace(args=args)))
+    return posts, update.message.reply_text.call_args[0][0]
+
+
+def test_delete_refuses_partial_sku_match(monkeypatch):
+    posts, reply = _run(monkeypatch, ["delete", "TEE"], [_variant("TEE-RED")])
+    assert [q for q, _ in posts] == [bot._Q_VARIANT_BY_SKU]
+    assert posts[0][1] == {"q": 'sku:"TEE"'}
+    assert "not found" in reply
+
+
+def test_price_update_targets_exact_variant(monkeypatch):
+    bot._PROD_CACHE["TEE-BLU"] = {"stale": True}
+    bot._PROD_CACHE["TEE-RED"] = {"stale": True}
+    edges = [_variant("TEE-RED", vid="gid://v/1"),
+             _variant("TEE-BLU", vid="gid://v/2", siblings=["TEE-RED"])]
+    posts, reply = _run(monkeypatch, ["update", "TEE-BLU", "price", "499"], edges)
+    assert posts[1] == (bot._Q_VARIANT_UPDATE,
+                        {"pid": "gid://p/1", "variants": [{"id": "gid://v/2", "price": "499"}]})
+    assert "TEE-BLU" not in bot._PROD_CACHE and "TEE-RED" not in bot._PROD_CACHE
+    assert reply.startswith("✅")
+
+
+def test_delete_keeps_sibling_variants(monkeypatch):
+    edges = [_variant("TEE-BLU", vid="gid://v/2", siblings=["TEE-RED"])]
+    posts, reply = _run(monkeypatch, ["delete", "TEE-BLU"], edges)
+    assert posts[1] == (bot._Q_VARIANT_DELETE, {"pid": "gid://p/1", "ids": ["gid://v/2"]})
+    assert reply.startswith("✅ Variant TEE-BLU deleted")
+
+
+def test_delete_last_variant_deletes_product(monkeypatch):
+    posts, reply = _run(monkeypatch, ["delete", "TEE-BLU"], [_variant("TEE-BLU")])
+    assert posts[1] == (bot._Q_PRODUCT_DELETE, {"id": "gid://p/1"})
+    assert reply == "✅ Product TEE-BLU deleted"
@@ -0,0 +1,37 @@
+"""A failed product lookup must not be reported as "no such SKU"."""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+import bot
+
+
+@pytest.fixture(autouse=True)
+def graphql_errors(monkeypatch):
+    async def fake_post(query, variables):
+        return {"errors": [{"message": "Internal error"}]}
+
+    monkeypatch.setattr(bot, "_graphql_post", fake_post)
+    monkeypatch.setattr(bot, "send_typing", lambda bot_, chat_id: None)
+
+
+def _update(text=""):
+    message = SimpleNamespace(text=text, reply_text=AsyncMock(), reply_markdown=AsyncMock())
+    return SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=1))
+
+
+def test_batched_lookup_failure_reaches_handle_sku():
+    update = _update("TEE-RED")
+    asyncio.run(bot.handle_sku(update, SimpleNamespace(bot=MagicMock())))
+    update.message.reply_markdown.assert_not_called()
+    assert update.message.reply_text.call_args[0][0] == "❌ Could not look up TEE-RED: Product lookup failed: Internal error"
+    assert "TEE-RED" not in bot._PROD_CACHE
+
+
+def test_alert_command_reports_failed_verification():
+    update = _update()
+    asyncio.run(bot.alert_command(update, SimpleNamespace(args=["TEE-RED", "5"])))
+    reply = update.message.reply_text.call_args[0][0]
+    assert reply == "❌ Could not verify SKU TEE-RED: Inventory lookup failed: Internal error"
@@ -0,0 +1,54 @@
+"""Redis is optional: a dead server costs one short timeout, then is skipped."""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bot
+
+
+class DeadRedis:
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, key):
+        self.calls += 1
+        raise TimeoutError("Timeout connecting to server")
+
+    set = delete = get
+
+
+@pytest.fixture
+def dead_redis(monkeypatch):
+    redis = DeadRedis()
+    monkeypatch.setattr(bot, "REDIS", redis)
+    monkeypatch.setattr(bot, "_redis_down_until", 0.0)
+    return redis
+
+
+def test_connection_failure_backs_off(dead_redis, monkeypatch):
+    async def scenario():
+        assert await bot.shared_cache_get("prod:A") is None
+        await bot.shared_cache_set("prod:A", {"x": 1}, 30)
+        await bot.shared_cache_delete("prod:A")
+        assert await bot.shared_cache_get("prod:A") is None
+
+    asyncio.run(scenario())
+    assert dead_redis.calls == 1
+
+    monkeypatch.setattr(bot.time, "monotonic", lambda: bot._redis_down_until + 1)
+    asyncio.run(bot.shared_cache_get("prod:A"))
+    assert dead_redis.calls == 2
+
+
+@pytest.mark.skipif(not bot.importlib.util.find_spec("redis"), reason="redis-py not installed")
+def test_client_is_built_with_short_timeouts():
+    # REDIS is created at import time, so check a fresh import with REDIS_URL set.
+    code = ("import bot; k = bot.REDIS.connection_pool.connection_kwargs; "
+            "print(k['socket_connect_timeout'], k['socket_timeout'])")
+    env = {**os.environ, "REDIS_URL": "redis://127.0.0.1:1/0"}
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    assert out.stdout.split() == ["0.5", "0.5"]
@@ -0,0 +1,60 @@
+"""shopify_rest retry policy: 429 for every method, 5xx/network only when idempotent."""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from aiolimiter import AsyncLimiter
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    sleeps, seen, script = [], [], []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    def handler(request):
+        seen.append(request.method)
+        step = script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    monkeypatch.setattr(bot.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(bot, "HTTP_CLIENT", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    # asyncio.run gives each call its own loop; the module limiter would be shared across them
+    monkeypatch.setattr(bot, "SHOPIFY_REST_LIMIT", AsyncLimiter(100, 1))
+    return SimpleNamespace(script=script, seen=seen, sleeps=sleeps)
+
+
+def _call(method):
+    return asyncio.run(bot.shopify_rest(method, "https://shop/admin/x.json", json={"a": 1}))
+
+
+def test_post_retries_429_with_retry_after(transport):
+    transport.script += [httpx.Response(429, headers={"Retry-After": "2.0"}), httpx.Response(201)]
+    assert _call("POST").status_code == 201
+    assert transport.seen == ["POST", "POST"]
+    assert transport.sleeps == [2.0]
+
+
+def test_post_does_not_retry_5xx(transport):
+    transport.script += [httpx.Response(502)]
+    assert _call("POST").status_code == 502
+    assert transport.seen == ["POST"]
+
+
+def test_post_does_not_retry_network_errors(transport):
+    transport.script += [httpx.ConnectError("boom")]
+    with pytest.raises(httpx.ConnectError):
+        _call("POST")
+    assert transport.seen == ["POST"]
+
+
+def test_put_retries_5xx_and_network_errors(transport):
+    transport.script += [httpx.Response(503), httpx.ReadError("reset"), httpx.Response(200)]
+    assert _call("PUT").status_code == 200
+    assert transport.seen == ["PUT", "PUT", "PUT"]
@@ -0,0 +1,39 @@
+"""PerChatUpdateProcessor: ordered per chat, but one busy chat never starves another."""
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update
+
+import bot
+
+
+def _update(update_id, chat_id):
+    chat = Chat(id=chat_id, type=Chat.PRIVATE)
+    return Update(update_id, message=Message(update_id, datetime.now(), chat))
+
+
+def test_blocked_chat_does_not_stall_other_chats():
+    async def scenario():
+        processor = bot.PerChatUpdateProcessor(max_concurrent_updates=2)
+        release = asyncio.Event()
+        done = []
+
+        async def handler(name, wait=False):
+            if wait:
+                await release.wait()
+            done.append(name)
+
+        # Chat 1: one stuck handler plus a backlog larger than the slot count.
+        tasks = [asyncio.create_task(processor.process_update(_update(i, 1), handler(f"a{i}", wait=i == 0)))
+                 for i in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(_update(99, 2), handler("b"))))
+        await asyncio.wait_for(asyncio.shield(tasks[-1]), timeout=1)
+        assert done == ["b"]
+        assert processor.current_concurrent_updates == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert done == ["b", "a0", "a1", "a2", "a3", "a4"]
+
+    asyncio.run(scenario())